@@ -0,0 +1,77 @@
+# app/bench_search.py
+
+"""
+bench_search.py — Measures /search response size and latency per field projection.
+
+Builds a throwaway Chroma collection of synthetic chunks (no embedding
+server needed) and, for several n_results values, times the Chroma query
+plus JSON encoding with the stdlib encoder (FastAPI's default path) and
+with orjson, and reports raw and gzipped response bytes.
+
+    python -m app.bench_search [num_docs] [chunk_chars]
+"""
+
+import gzip
+import json
+import random
+import sys
+import tempfile
+import time
+from fastapi.encoders import jsonable_encoder
+from app.db import ChromaDatabase
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROJECTIONS = {
+    "full": None,
+    "ids+distance": ["id", "distance"],
+    "metadata": ["id", "metadata"],
+    "text<=200": ["id", "text", "distance"],
+}
+N_RESULTS = (5, 20, 50, 200)
+DIM = 384
+REPEATS = 20
+
+
+def _timed(fn, repeats=REPEATS):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    return (time.perf_counter() - start) / repeats * 1000, out
+
+
+def main(num_docs: int = 5000, chunk_chars: int = 4000):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as path:
+        db = ChromaDatabase(db_path=path, collection_name="bench")
+        batch = 500
+        for start in range(0, num_docs, batch):
+            ids = [f"doc-{i}" for i in range(start, min(start + batch, num_docs))]
+            db.collection.add(
+                ids=ids,
+                embeddings=[[rng.random() for _ in range(DIM)] for _ in ids],
+                documents=["lorem ipsum " * (chunk_chars // 12) for _ in ids],
+                metadatas=[{"path": f"/data/folder/{i}.txt", "name": f"{i}.txt", "size": chunk_chars}
+                           for i in ids],
+            )
+        query = [rng.random() for _ in range(DIM)]
+
+        print(f"{num_docs} docs x {chunk_chars} chars, mean of {REPEATS} runs")
+        print(f"{'projection':<14}{'n':>5}{'query ms':>10}{'stdlib ms':>11}{'orjson ms':>11}"
+              f"{'bytes':>10}{'gzip':>9}")
+        for n in N_RESULTS:
+            for label, fields in PROJECTIONS.items():
+                max_chars = 200 if label == "text<=200" else None
+                query_ms, results = _timed(lambda: db.query_similar(query, n, fields, max_chars))
+                body = {"results": results}
+                std_ms, raw = _timed(lambda: json.dumps(jsonable_encoder(body)).encode("utf-8"))
+                fast_ms = _timed(lambda: orjson.dumps(body))[0] if orjson else float("nan")
+                print(f"{label:<14}{n:>5}{query_ms:>10.2f}{std_ms:>11.3f}{fast_ms:>11.3f}"
+                      f"{len(raw):>10}{len(gzip.compress(raw)):>9}")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -1,15 +1,96 @@
 # app/db.py
 
 import chromadb
+import hashlib
+import heapq
+import json
+import re
+import threading
 import uuid
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Union
 from app.utilities.config import load_config
 
+ACTIVE_COLLECTIONS_FILE = "active_collections.json"
+
+# Fields query_similar can return, and the Chroma include each one needs
+RESULT_FIELDS = {"id": None, "text": "documents", "metadata": "metadatas", "distance": "distances"}
+DEFAULT_RESULT_FIELDS = ("text", "metadata", "distance")
+_pointer_lock = threading.Lock()
+
+def _read_pointers(db_path) -> Dict[str, Any]:
+    """Logical -> {collection, model} map from db_path's active_collections.json."""
+    try:
+        with open(os.path.join(db_path, ACTIVE_COLLECTIONS_FILE), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"[CHROMA ERROR] Could not read {ACTIVE_COLLECTIONS_FILE}: {e}")
+        return {}
+
+def _write_pointers(db_path, pointers: Dict[str, Any]) -> None:
+    path = os.path.join(db_path, ACTIVE_COLLECTIONS_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(pointers, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _scan_entries(collection, page_size: int = 1000):
+    """Return (distinct file paths, ids of entries without a path) in a collection."""
+    paths, note_ids = set(), []
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+        if not page["ids"]:
+            break
+        for entry_id, meta in zip(page["ids"], page["metadatas"]):
+            if meta and meta.get("path"):
+                paths.add(meta["path"])
+            else:
+                note_ids.append(entry_id)
+        offset += len(page["ids"])
+    return paths, note_ids
+
+def _fetch_entries(collection, ids: List[str], page_size: int = 500) -> List[Dict[str, Any]]:
+    """Load entries by ID including their stored embeddings."""
+    entries = []
+    for start in range(0, len(ids), page_size):
+        page = collection.get(ids=ids[start:start + page_size],
+                              include=["documents", "metadatas", "embeddings"])
+        for entry_id, doc, meta, emb in zip(
+            page["ids"], page["documents"], page["metadatas"], page["embeddings"]
+        ):
+            entries.append({"id": entry_id, "text": doc, "metadata": meta, "embedding": emb})
+    return entries
+
+def _put_entries(route, entries: List[Dict[str, Any]]) -> None:
+    """Upsert entries (with their embeddings) into the collection route(entry) picks."""
+    groups: Dict[str, Any] = {}
+    for entry in entries:
+        target = route(entry)
+        groups.setdefault(target.name, (target, []))[1].append(entry)
+    for target, rows in groups.values():
+        target.upsert(
+            ids=[e["id"] for e in rows],
+            documents=[e["text"] for e in rows],
+            metadatas=[e["metadata"] for e in rows],
+            embeddings=[e["embedding"] for e in rows],
+        )
+
 class ChromaDatabase:
     """
     Pluggable, config-driven wrapper for ChromaDB vector database.
     Supports adding, querying, and managing embedded documents for RAG.
+
+    collection_name is a logical name. After an embedding-model migration
+    (see app/migrate.py) it points at a versioned collection, recorded in
+    active_collections.json inside db_path along with the model that built it.
+    A collection without a recorded model (new, or created before models were
+    recorded) is recorded with the embedding_model from config on first open.
+    Reads and writes re-check that file (one stat) so a switch made by another
+    process is picked up, and add_entry rejects vectors whose metadata
+    "embedding_model" doesn't match the active collection's model.
     """
 
     def __init__(self, 
@@ -25,12 +106,69 @@ class ChromaDatabase:
             "CHROMA_DB_PATH", config.get("chroma_db_path", "chroma_data")
         )
         self.collection_name = collection_name or "assistant_data"
+        self._pointer_signature = self._stat_pointers()
+        self.switch_lock = threading.RLock()  # held by add_entry and around migration switches
+        active = self._read_pointers().get(self.collection_name, {})
+        self.active_collection = active.get("collection", self.collection_name)
+        self.active_model = active.get("model")
         try:
             self.client = chromadb.PersistentClient(path=self.db_path)
-            self.collection = self.client.get_or_create_collection(self.collection_name)
+            self.collection = self.client.get_or_create_collection(self.active_collection)
         except Exception as e:
             print(f"[CHROMA ERROR] Could not connect to ChromaDB: {e}")
             raise
+        if self.active_model is None:
+            self._record_model(config.get("embedding_model", "nomic-embed-text:v1.5"))
+
+    def _record_model(self, model: str) -> None:
+        """Record `model` for this collection unless another process just did."""
+        with _pointer_lock:
+            pointers = _read_pointers(self.db_path)
+            active = pointers.get(self.collection_name, {})
+            if not active.get("model"):
+                active = {"collection": active.get("collection", self.active_collection), "model": model}
+                pointers[self.collection_name] = active
+                _write_pointers(self.db_path, pointers)
+        self._pointer_signature = None  # force refresh() to load what is on disk
+        self.refresh()
+
+    def _read_pointers(self) -> Dict[str, Any]:
+        return _read_pointers(self.db_path)
+
+    def _stat_pointers(self):
+        try:
+            st = os.stat(os.path.join(self.db_path, ACTIVE_COLLECTIONS_FILE))
+            return (st.st_mtime_ns, st.st_ino, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> None:
+        """Pick up a collection switch made by another process (e.g. a CLI migration)."""
+        signature = self._stat_pointers()
+        if signature == self._pointer_signature:
+            return
+        self._pointer_signature = signature
+        active = self._read_pointers().get(self.collection_name, {})
+        name = active.get("collection", self.collection_name)
+        if name != self.active_collection:
+            self.collection = self.client.get_or_create_collection(name)
+            self.active_collection = name
+            print(f"[CHROMA] {self.collection_name} switched to {name}")
+        self.active_model = active.get("model")
+
+    def switch_collection(self, physical_name: str, model: Optional[str] = None) -> None:
+        """
+        Point this logical collection at another physical collection.
+        Swaps in-process immediately and persists the choice for restarts.
+        """
+        collection = self.client.get_or_create_collection(physical_name)
+        with _pointer_lock:
+            pointers = _read_pointers(self.db_path)
+            pointers[self.collection_name] = {"collection": physical_name, "model": model}
+            _write_pointers(self.db_path, pointers)
+        self.collection = collection
+        self.active_collection = physical_name
+        self.active_model = model
 
     def add_entry(
         self, 
@@ -45,53 +183,76 @@ class ChromaDatabase:
         Args:
             text (str): The main document content.
             embedding (list of float): The vector embedding for the document.
-            metadata (dict): Extra info for filtering/searching.
+            metadata (dict): Extra info for filtering/searching. If it has an
+                "embedding_model" that differs from the active model, the entry is rejected.
             entry_id (str, optional): Use your own UUID if you want.
 
         Returns:
-            str: The entry's unique ID.
+            str: The entry's unique ID, or None on failure/rejection.
         """
         if entry_id is None:
             entry_id = str(uuid.uuid4())
-        try:
-            self.collection.add(
-                embeddings=[embedding],
-                documents=[text],
-                ids=[entry_id],
-                metadatas=[metadata]
-            )
-            return entry_id
-        except Exception as e:
-            print(f"[CHROMA ERROR] Add failed: {e}")
-            return None
+        model = metadata.get("embedding_model") if metadata else None
+        with self.switch_lock:
+            self.refresh()
+            if model and self.active_model and model != self.active_model:
+                print(f"[CHROMA ERROR] Add rejected: embedded with '{model}', "
+                      f"collection uses '{self.active_model}'")
+                return None
+            try:
+                self.collection.add(
+                    embeddings=[embedding],
+                    documents=[text],
+                    ids=[entry_id],
+                    metadatas=[metadata]
+                )
+                return entry_id
+            except Exception as e:
+                print(f"[CHROMA ERROR] Add failed: {e}")
+                return None
 
     def query_similar(
         self, 
         embedding: List[float], 
-        n_results: int = 5
+        n_results: int = 5,
+        fields: Optional[List[str]] = None,
+        max_text_chars: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Find the most similar entries to a given embedding.
 
+        Args:
+            embedding (list of float): Query vector.
+            n_results (int): Number of results.
+            fields (list of str, optional): Any of id, text, metadata, distance.
+                Only the matching columns are loaded from Chroma.
+            max_text_chars (int, optional): Truncate returned text to this length.
+
         Returns:
-            List[dict]: Each with keys: text, metadata, distance
+            List[dict]: Each with the requested keys (default: text, metadata, distance)
         """
+        fields = list(fields or DEFAULT_RESULT_FIELDS)
+        unknown = [f for f in fields if f not in RESULT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown result fields: {unknown}")
+        include = [RESULT_FIELDS[f] for f in fields if RESULT_FIELDS[f]]
+        self.refresh()
         try:
             results = self.collection.query(
                 query_embeddings=[embedding],
                 n_results=n_results,
-                include=["documents", "metadatas", "distances"]
+                include=include
             )
-            output = []
-            for doc, meta, dist in zip(
-                results["documents"][0], results["metadatas"][0], results["distances"][0]
-            ):
-                output.append({
-                    "text": doc,
-                    "metadata": meta,
-                    "distance": dist
-                })
-            return output
+            columns = {"id": results["ids"][0]}
+            for field in fields:
+                if RESULT_FIELDS[field]:
+                    columns[field] = results[RESULT_FIELDS[field]][0]
+            if max_text_chars is not None and "text" in columns:
+                columns["text"] = [t[:max_text_chars] if t else t for t in columns["text"]]
+            return [
+                {field: columns[field][i] for field in fields}
+                for i in range(len(columns["id"]))
+            ]
         except Exception as e:
             print(f"[CHROMA ERROR] Query failed: {e}")
             return []
@@ -141,6 +302,7 @@ class ChromaDatabase:
         Returns:
             bool
         """
+        self.refresh()
         try:
             results = self.collection.get(where={"file_key": file_key}, include=["metadatas"])
             return bool(results["ids"])
@@ -148,3 +310,292 @@ class ChromaDatabase:
             print(f"[CHROMA ERROR] file_already_learned failed: {e}")
             return False
 
+    def file_paths(self) -> List[str]:
+        """Return the distinct source file paths stored in the collection."""
+        try:
+            return sorted(_scan_entries(self.collection)[0])
+        except Exception as e:
+            print(f"[CHROMA ERROR] file_paths failed: {e}")
+            return []
+
+    def reset(self) -> None:
+        """Drop and recreate the collection (all entries are lost)."""
+        try:
+            self.client.delete_collection(self.active_collection)
+        except Exception as e:
+            print(f"[CHROMA ERROR] Reset failed: {e}")
+        self.collection = self.client.get_or_create_collection(self.active_collection)
+
+
+class ShardedChromaDatabase:
+    """
+    Spreads entries across N ChromaDatabase shards, each its own collection
+    (or its own persistent directory with separate_dirs=True).
+
+    Writes are routed by shard_by:
+        - "hash": hash of metadata["file_key"] (falls back to entry ID)
+        - "folder": hash of the file's parent folder, so one folder's
+          re-ingest only touches one shard
+    Queries fan out to every shard concurrently and merge the top-k by distance.
+
+    After changing the shard count, shard_by or shard dirs, run reshard()
+    to move existing entries into the new layout.
+    """
+
+    def __init__(self,
+                 num_shards: Optional[int] = None,
+                 shard_by: Optional[str] = None,
+                 db_path: Optional[str] = None,
+                 collection_name: Optional[str] = None,
+                 separate_dirs: Optional[bool] = None):
+        """
+        Args:
+            num_shards (int, optional): Number of shards. Reads chroma_shards from config if not provided.
+            shard_by (str, optional): "hash" or "folder". Reads chroma_shard_by from config if not provided.
+            db_path (str, optional): Path to ChromaDB folder. Reads from config if not provided.
+            collection_name (str, optional): Base collection name; shard i uses "<name>_<i>".
+            separate_dirs (bool, optional): Give each shard its own "shard_<i>" directory under db_path.
+        """
+        config = load_config()
+        self.num_shards = int(num_shards or config.get("chroma_shards", 1))
+        self.shard_by = shard_by or config.get("chroma_shard_by", "hash")
+        if self.shard_by not in ("hash", "folder"):
+            raise ValueError(f"Unknown shard_by: {self.shard_by}")
+        if separate_dirs is None:
+            separate_dirs = bool(config.get("chroma_shard_dirs", False))
+        self.db_path = db_path or os.environ.get(
+            "CHROMA_DB_PATH", config.get("chroma_db_path", "chroma_data")
+        )
+        self.collection_name = collection_name or "assistant_data"
+
+        self.shards = []
+        for i in range(self.num_shards):
+            path = os.path.join(self.db_path, f"shard_{i}") if separate_dirs else self.db_path
+            self.shards.append(ChromaDatabase(db_path=path, collection_name=f"{self.collection_name}_{i}"))
+        self._executor = ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="chroma-shard")
+        self.switch_lock = threading.RLock()  # held by add_entry and around migration switches
+
+    @property
+    def active_model(self) -> Optional[str]:
+        """Embedding model recorded for the shards by the last migration, if any."""
+        return self.shards[0].active_model
+
+    def refresh(self) -> None:
+        """Pick up collection switches made by another process."""
+        for shard in self.shards:
+            shard.refresh()
+
+    @staticmethod
+    def _bucket(value: str, n: int) -> int:
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest(), 16) % n
+
+    def shard_index(self, metadata: Dict[str, Any], entry_id: Optional[str] = None) -> Optional[int]:
+        """
+        Return the shard index for an entry, or None if it can't be determined
+        from this metadata (callers then fan out to every shard).
+        """
+        if self.shard_by == "folder" and metadata.get("path"):
+            return self._bucket(os.path.dirname(metadata["path"]), self.num_shards)
+        if self.shard_by == "hash" and metadata.get("file_key"):
+            return self._bucket(str(metadata["file_key"]), self.num_shards)
+        if entry_id is not None:
+            return self._bucket(entry_id, self.num_shards)
+        return None
+
+    def _fan_out(self, fn) -> List[Any]:
+        return list(self._executor.map(fn, self.shards))
+
+    def add_entry(
+        self,
+        text: str,
+        embedding: List[float],
+        metadata: Dict[str, Any],
+        entry_id: Optional[str] = None
+    ) -> str:
+        """Add a new entry to the shard it routes to. Returns the entry's ID."""
+        if entry_id is None:
+            entry_id = str(uuid.uuid4())
+        shard = self.shards[self.shard_index(metadata, entry_id)]
+        with self.switch_lock:
+            return shard.add_entry(text, embedding, metadata, entry_id)
+
+    def query_similar(
+        self,
+        embedding: List[float],
+        n_results: int = 5,
+        fields: Optional[List[str]] = None,
+        max_text_chars: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Query every shard concurrently and merge the per-shard top-k by distance.
+        Accepts the same field projection as ChromaDatabase.query_similar.
+
+        Returns:
+            List[dict]: Each with the requested keys (default: text, metadata, distance)
+        """
+        fields = list(fields or DEFAULT_RESULT_FIELDS)
+        shard_fields = fields if "distance" in fields else fields + ["distance"]
+        per_shard = self._fan_out(
+            lambda shard: shard.query_similar(embedding, n_results, shard_fields, max_text_chars)
+        )
+        merged = (r for results in per_shard for r in results)
+        top = heapq.nsmallest(n_results, merged, key=lambda r: r["distance"])
+        if "distance" not in fields:
+            for r in top:
+                del r["distance"]
+        return top
+
+    def get_by_id(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve a single entry by unique ID from whichever shard holds it."""
+        for result in self._fan_out(lambda shard: shard.get_by_id(entry_id)):
+            if result is not None:
+                return result
+        return None
+
+    def all_entry_ids(self) -> List[str]:
+        """Return all entry IDs across shards."""
+        return [i for ids in self._fan_out(lambda shard: shard.all_entry_ids()) for i in ids]
+
+    def delete_entry(self, entry_id: str) -> None:
+        """Delete an entry by its unique ID from every shard."""
+        self._fan_out(lambda shard: shard.delete_entry(entry_id))
+
+    def file_already_learned(self, file_key: str) -> bool:
+        """Returns True if a file with this file_key is already in any shard."""
+        index = self.shard_index({"file_key": file_key})
+        if index is not None:
+            return self.shards[index].file_already_learned(file_key)
+        return any(self._fan_out(lambda shard: shard.file_already_learned(file_key)))
+
+    def rebuild_shard(self, index: int, queue) -> Dict[str, int]:
+        """
+        Wipe one shard and re-queue the files it contained for ingest.
+        Entries without a source file (notes from /add and /learn) can't be
+        re-ingested, so they are copied back with their stored embeddings.
+        Other shards keep serving reads throughout; writes wait on
+        switch_lock so nothing added mid-rebuild is wiped by the reset.
+
+        Args:
+            index (int): Shard to rebuild.
+            queue: An IngestQueue (must have .requeue(path)).
+
+        Returns:
+            dict: {"requeued": files re-queued, "kept": path-less entries restored}
+        """
+        shard = self.shards[index]
+        with self.switch_lock:
+            paths, note_ids = _scan_entries(shard.collection)
+            notes = _fetch_entries(shard.collection, note_ids)
+            shard.reset()
+            if notes:
+                _put_entries(lambda entry: shard.collection, notes)
+        for path in sorted(paths):
+            queue.requeue(path)
+        print(f"[CHROMA] Rebuilding shard {index}: {len(paths)} files re-queued, {len(notes)} notes kept")
+        return {"requeued": len(paths), "kept": len(notes)}
+
+
+def open_database(**kwargs) -> Union[ChromaDatabase, ShardedChromaDatabase]:
+    """
+    Return a ShardedChromaDatabase if chroma_shards > 1 in config, else a plain ChromaDatabase.
+    Warns when config's embedding_model differs from the model the stored
+    vectors were built with; that recorded model stays in use until migrated.
+    """
+    config = load_config()
+    if int(config.get("chroma_shards", 1)) > 1:
+        db = ShardedChromaDatabase(**kwargs)
+    else:
+        db = ChromaDatabase(**kwargs)
+    configured = config.get("embedding_model", "nomic-embed-text:v1.5")
+    if db.active_model and configured != db.active_model:
+        print(f"[CHROMA WARNING] config embedding_model is '{configured}' but the stored vectors "
+              f"were built with '{db.active_model}'; still using '{db.active_model}'. "
+              f"Run `python -m app.migrate {configured}` or POST /admin/migrate to switch.")
+    return db
+
+
+def reshard(db) -> Dict[str, Any]:
+    """
+    Move entries out of collections left behind by a change to chroma_shards,
+    chroma_shard_dirs or sharding on/off, into the database's current layout,
+    and re-route entries whose shard changed with chroma_shard_by.
+
+    Entries are copied with their stored embeddings and routed like new
+    writes, then the old collection is dropped. While the current layout is
+    still empty it adopts the model of the first leftover collection (e.g.
+    resharding after a migration); after that, collections built with a
+    different embedding model are skipped; migrate (app/migrate.py) first.
+
+    Args:
+        db: The current ChromaDatabase or ShardedChromaDatabase.
+
+    Returns:
+        dict: {"imported": [collection names], "copied": entries moved, "skipped": [collection names]}
+    """
+    base = db.collection_name
+    shards = getattr(db, "shards", [db])
+    current = {(os.path.abspath(str(s.db_path)), s.collection_name) for s in shards}
+    if hasattr(db, "shards"):
+        route = lambda entry: db.shards[db.shard_index(entry["metadata"] or {}, entry["id"])].collection
+    else:
+        route = lambda entry: db.collection
+
+    # The shared directory plus any per-shard directories
+    root = str(db.db_path)
+    locations = [root] + sorted(
+        os.path.join(root, d) for d in os.listdir(root)
+        if d.startswith("shard_") and os.path.isdir(os.path.join(root, d))
+    )
+    logical_names = re.compile(rf"^{re.escape(base)}(_\d+)?$")
+    report = {"imported": [], "copied": 0, "skipped": []}
+
+    for location in locations:
+        client = chromadb.PersistentClient(path=location)
+        pointers = _read_pointers(location)
+        physical = {c.name for c in client.list_collections()}
+        for logical in sorted(set(pointers) | physical):
+            if not logical_names.match(logical) or (os.path.abspath(location), logical) in current:
+                continue
+            name = pointers.get(logical, {}).get("collection", logical)
+            if name not in physical:
+                continue
+            model = pointers.get(logical, {}).get("model")
+            if model and model != db.active_model and all(s.collection.count() == 0 for s in shards):
+                for shard in shards:
+                    shard.switch_collection(shard.active_collection, model)
+                print(f"[CHROMA] Empty layout adopts '{model}' from {location}/{name}")
+            if model and model != db.active_model:
+                print(f"[CHROMA] Skipping {location}/{name}: built with a different embedding model")
+                report["skipped"].append(name)
+                continue
+            old = client.get_collection(name)
+            ids = old.get(include=[])["ids"]
+            for start in range(0, len(ids), 500):
+                _put_entries(route, _fetch_entries(old, ids[start:start + 500]))
+            client.delete_collection(name)
+            if logical in pointers:
+                with _pointer_lock:
+                    pointers = _read_pointers(location)
+                    pointers.pop(logical, None)
+                    _write_pointers(location, pointers)
+            print(f"[CHROMA] Imported {len(ids)} entries from {location}/{name}")
+            report["imported"].append(name)
+            report["copied"] += len(ids)
+
+    # Entries in current shards that route elsewhere (e.g. after changing shard_by)
+    if hasattr(db, "shards"):
+        for index, shard in enumerate(db.shards):
+            moved, offset = [], 0
+            while True:
+                page = shard.collection.get(limit=1000, offset=offset, include=["metadatas"])
+                if not page["ids"]:
+                    break
+                moved += [i for i, meta in zip(page["ids"], page["metadatas"])
+                          if db.shard_index(meta or {}, i) != index]
+                offset += len(page["ids"])
+            for start in range(0, len(moved), 500):
+                chunk = moved[start:start + 500]
+                _put_entries(route, _fetch_entries(shard.collection, chunk))
+                shard.collection.delete(ids=chunk)
+            report["copied"] += len(moved)
+    return report
@@ -1,29 +1,52 @@
 # app/embeddings.py
 
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, List, Optional
 from app.utilities.config import load_config
+from app.throttle import AdaptiveLimiter, BACKGROUND
+from app.endpoints import EndpointPool
 
 class Embedder:
     """
     Generic embedder for text using a local or remote embedding server (e.g., Ollama, Nomic).
     Reads config from config.yaml.
+
+    Requests go through an AdaptiveLimiter, which tunes in-flight request
+    count and batch size from observed latency, and lets interactive callers
+    (priority="interactive") jump ahead of background ingest.
+
+    `url` / `embedding_url` may be a single URL or a list of URLs; requests
+    are spread across them by least-outstanding-requests via an EndpointPool.
     """
 
-    def __init__(self, url: Optional[str] = None, model: Optional[str] = None):
+    def __init__(self,
+                 url: Optional[Union[str, List[str]]] = None,
+                 model: Optional[str] = None,
+                 limiter: Optional[AdaptiveLimiter] = None):
         config = load_config()
-       
-        self.url = url or config.get("embedding_url", "http://localhost:11434/api/embeddings")
+
+        urls = url or config.get("embedding_url", "http://localhost:11434/api/embeddings")
+        self.urls = [urls] if isinstance(urls, str) else list(urls)
+        self.url = self.urls[0]
+        self.pool = EndpointPool.from_config(self.urls, config)
 
         self.model = model or config.get("embedding_model", "nomic-embed-text:v1.5")
-        self.timeout = 15  # seconds
+        self.timeout = float(config.get("embedding_timeout", 15))  # seconds
+        self.limiter = limiter or AdaptiveLimiter.from_config(config, scale=len(self.urls))
 
-    def embed(self, text: Union[str, List[str]]) -> Union[List[float], List[List[float]], None]:
+    def embed(
+        self,
+        text: Union[str, List[str]],
+        priority: str = BACKGROUND
+    ) -> Union[List[float], List[List[float]], None]:
         """
         Embed text or list of texts. Returns embedding(s) or None on failure.
 
         Args:
             text (str or list of str): Text to embed.
+            priority (str): "interactive" for user-facing calls, "background" otherwise.
 
         Returns:
             list of floats (for single input) or list of list of floats (for batch).
@@ -31,23 +54,68 @@ class Embedder:
         if not text:
             raise ValueError("No text provided for embedding.")
 
+        if not isinstance(text, list):
+            return self._request(text, priority)
+
+        # Split batches to the size the limiter currently considers healthy,
+        # and send the chunks concurrently so they spread across endpoints
+        size = self.limiter.batch_size
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        if len(chunks) == 1:
+            return self._request(chunks[0], priority)
+        workers = min(len(chunks), max(self.limiter.limit, len(self.pool)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda c: self._request(c, priority), chunks))
+        if any(r is None for r in results):
+            return None
+        return [vec for chunk in results for vec in chunk]
+
+    def _request(self, text: Union[str, List[str]], priority: str):
+        """
+        Send a single request under the limiter. On failure, retries once
+        on a different endpoint when more than one is configured.
+        """
+        with self.limiter.slot(priority) as outcome:
+            endpoint = None
+            attempts = min(2, len(self.pool))
+            for _ in range(attempts):
+                endpoint = self.pool.acquire(exclude=endpoint)
+                start = time.monotonic()
+                try:
+                    result = self._post(endpoint.url, text)
+                    self.pool.release(endpoint, time.monotonic() - start, True,
+                                      items=len(text) if isinstance(text, list) else 1)
+                    return result
+                except Exception as e:
+                    self.pool.release(endpoint, time.monotonic() - start, False,
+                                      reachable=not isinstance(e, requests.ConnectionError))
+                    print(f"[EMBEDDINGS ERROR] {endpoint.url}: {e}")
+            outcome["ok"] = False
+            return None
+
+    def _post(self, url: str, text: Union[str, List[str]]):
         is_batch = isinstance(text, list)
         payload = {"model": self.model, "prompt": text}
+        r = requests.post(url, json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        # Ollama/Nomic will return 'embedding' for single, 'embeddings' for batch
+        if is_batch and "embeddings" in data:
+            return data["embeddings"]
+        elif not is_batch and "embedding" in data:
+            return data["embedding"]
+        else:
+            raise ValueError(f"Unexpected embedding response format: {data}")
 
-        try:
-            r = requests.post(self.url, json=payload, timeout=self.timeout)
-            r.raise_for_status()
-            data = r.json()
-            # Ollama/Nomic will return 'embedding' for single, 'embeddings' for batch
-            if is_batch and "embeddings" in data:
-                return data["embeddings"]
-            elif not is_batch and "embedding" in data:
-                return data["embedding"]
-            else:
-                raise ValueError(f"Unexpected embedding response format: {data}")
-        except Exception as e:
-            print(f"[EMBEDDINGS ERROR] {e}")
-            return None
+    def outage(self) -> Optional[float]:
+        """Seconds to wait if every embedding server is down, else None."""
+        return self.pool.outage()
+
+    def stats(self):
+        """Return limiter stats plus per-endpoint health, latency and throughput."""
+        stats = self.limiter.stats()
+        stats["endpoints"] = self.pool.stats()
+        return stats
 
 # Backwards compatible functional API if you want to use elsewhere:
 _embedder = Embedder()
@@ -0,0 +1,162 @@
+# app/endpoints.py
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+class Endpoint:
+    """
+    One embedding server URL plus its passive health and load stats.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.items = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.backoff_level = 0
+        self.unreachable = False  # last request never connected
+        self.avg_latency: Optional[float] = None
+        self._recent = deque()  # (finish time, items) within the throughput window
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def stats(self, now: float, window: float) -> Dict[str, Any]:
+        while self._recent and self._recent[0][0] < now - window:
+            self._recent.popleft()
+        return {
+            "url": self.url,
+            "healthy": not self.is_ejected(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "avg_latency": self.avg_latency,
+            "items_per_sec": round(sum(n for _, n in self._recent) / window, 3),
+        }
+
+
+class EndpointPool:
+    """
+    Load-balances embedding requests across several local servers.
+
+    - acquire() picks the healthy endpoint with the fewest outstanding requests
+    - release() records latency/outcome; after eject_after consecutive failures
+      an endpoint is ejected for a cooldown that doubles on each re-ejection
+    - once the cooldown expires the endpoint is re-admitted; a success resets it,
+      another failure ejects it again
+    - outage() reports when every endpoint is down, so callers can pause
+      instead of failing (and using up retries on) every queued file
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        eject_after: int = 3,
+        cooldown: float = 10.0,
+        max_cooldown: float = 300.0,
+        stats_window: float = 60.0,
+    ):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one URL.")
+        self.endpoints = [Endpoint(u) for u in urls]
+        self.eject_after = eject_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.stats_window = stats_window
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, urls: List[str], config: Dict[str, Any]) -> "EndpointPool":
+        """Build a pool from the embedding_eject_* keys in config.yaml."""
+        return cls(
+            urls,
+            eject_after=int(config.get("embedding_eject_after", 3)),
+            cooldown=float(config.get("embedding_eject_cooldown", 10)),
+            max_cooldown=float(config.get("embedding_eject_max_cooldown", 300)),
+        )
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def acquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Reserve the least-loaded healthy endpoint.
+        If every endpoint is ejected, falls back to the one due back soonest.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e is not exclude] or self.endpoints
+            healthy = [e for e in candidates if not e.is_ejected(now)]
+            if healthy:
+                fewest = min(e.outstanding for e in healthy)
+                endpoint = random.choice([e for e in healthy if e.outstanding == fewest])
+            else:
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency: float, ok: bool, items: int = 1,
+                reachable: bool = True) -> None:
+        """
+        Return an endpoint to the pool and update its health/latency stats.
+        reachable=False marks a failure where the request never connected.
+        """
+        with self._lock:
+            now = time.monotonic()
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            endpoint.requests += 1
+            endpoint.unreachable = not ok and not reachable
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = 0.0
+                endpoint.backoff_level = 0
+                endpoint.items += items
+                endpoint._recent.append((now, items))
+                endpoint.avg_latency = latency if endpoint.avg_latency is None else (
+                    0.8 * endpoint.avg_latency + 0.2 * latency
+                )
+                return
+
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_after:
+                delay = min(self.cooldown * 2 ** endpoint.backoff_level, self.max_cooldown)
+                endpoint.backoff_level += 1
+                endpoint.ejections += 1
+                endpoint.ejected_until = now + delay
+                # Re-admission gets one probe before the next ejection
+                endpoint.consecutive_failures = self.eject_after - 1
+                print(f"[EMBEDDINGS] Ejected {endpoint.url} for {delay:.0f}s")
+
+    def outage(self) -> Optional[float]:
+        """
+        If every endpoint is ejected or refusing connections, return the
+        seconds until the first one may be usable again; otherwise None.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not all(e.is_ejected(now) or e.unreachable for e in self.endpoints):
+                return None
+            return max(1.0, min(
+                e.ejected_until - now if e.is_ejected(now) else self.cooldown
+                for e in self.endpoints
+            ))
+
+    def healthy_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for e in self.endpoints if not e.is_ejected(now))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint health, latency and throughput."""
+        with self._lock:
+            now = time.monotonic()
+            return [e.stats(now, self.stats_window) for e in self.endpoints]
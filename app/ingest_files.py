@@ -1,12 +1,14 @@
 # app/ingest_files.py
 
 import os
+import signal
 from app.learn import Learner
 from app.embeddings import Embedder
-from app.db import ChromaDatabase
+from app.db import ChromaDatabase, open_database
 from app.queue import IngestQueue
 from app.utilities.files import get_file_metadata, parse_mtime_string, get_file_snippet
 from app.utilities.config import load_config
+from app.profiling import tracer, install_signal_handlers
 
 config = load_config()
 SKIP_EXTS = tuple(config["skip_exts"])
@@ -23,54 +25,91 @@ def process_next_file(queue: IngestQueue, learner: Learner, db: ChromaDatabase):
     - Skips unreadable or already-learned files
     - Extracts a snippet
     - Embeds and stores new content
+    - Sends files that fail to embed/store to the retry queue
+    - During an embedding server outage, puts the file back without using
+      up an attempt and pauses claims until the servers may be back
+    Timings per stage are recorded by the slow-op tracer when enabled.
     """
-    path = queue.get_next_file()
-    if not path:
-        print("[QUEUE] No pending files.")
-        return False
+    with tracer.trace("ingest"):
+        with tracer.span("queue.get"):
+            path = queue.get_next_file()
+        if not path:
+            return False
+        tracer.set_key(path)
+        return _process_file(path, queue, learner, db)
 
+def _mark_done(queue: IngestQueue, path: str):
+    with tracer.span("queue.mark"):
+        queue.mark_done(path)
+
+def _mark_failed(queue: IngestQueue, path: str, error: str):
+    with tracer.span("queue.mark"):
+        queue.mark_failed(path, error)
+
+def _defer(queue: IngestQueue, path: str, delay: float, error: str):
+    with tracer.span("queue.mark"):
+        queue.defer(path, delay, error)
+
+def _process_file(path: str, queue: IngestQueue, learner: Learner, db: ChromaDatabase):
     if should_skip_file(path):
         print(f"[SKIP] {path} — app or executable")
-        queue.mark_done(path)
+        _mark_done(queue, path)
         return True  # keep going!
 
     try:
-        snippet = get_file_snippet(path)
+        with tracer.span("extract"):
+            snippet = get_file_snippet(path)
         if not snippet.strip():
             print(f"[SKIP] {path} — empty or unreadable")
-            queue.mark_done(path)
+            _mark_done(queue, path)
             return True
 
-        metadata = get_file_metadata(path)
-        if isinstance(metadata["mtime"], str):
-            metadata["mtime"] = parse_mtime_string(metadata["mtime"])
+        with tracer.span("extract"):
+            metadata = get_file_metadata(path)
+            if isinstance(metadata["mtime"], str):
+                metadata["mtime"] = parse_mtime_string(metadata["mtime"])
         key = file_key(metadata)
         metadata["file_key"] = key
 
-        if db.file_already_learned(key):
+        with tracer.span("chroma.lookup"):
+            learned = db.file_already_learned(key)
+        if learned:
             print(f"[SKIP] {path} — already learned")
-            queue.mark_done(path)
+            _mark_done(queue, path)
             return True
 
         result = learner.learn_text(snippet, metadata)
         if result["status"] == "success":
             print(f"[LEARNED] {metadata['name']} → {result['id']}")
+            _mark_done(queue, path)
+        elif result.get("retry_after") is not None:
+            print(f"[PAUSED] Embedding servers unavailable, pausing ingest for "
+                  f"{result['retry_after']:.0f}s")
+            _defer(queue, path, result["retry_after"], result.get("error", "outage"))
         else:
-            print(f"[ERROR] {metadata['name']} — {result.get('error', 'unknown error')}")
-        queue.mark_done(path)
+            error = result.get('error', 'unknown error')
+            print(f"[RETRY] {metadata['name']} — {error}")
+            _mark_failed(queue, path, error)
         return True
 
     except Exception as e:
         print(f"[ERROR] {path}: {e}")
-        queue.mark_done(path)
+        _mark_failed(queue, path, str(e))
         return True  # don't get stuck, just keep going
 
 if __name__ == "__main__":
+    from app.workers import IngestWorkerPool
+
     queue = IngestQueue()
-    db = ChromaDatabase()
-    embedder = Embedder()
+    db = open_database()
+    embedder = Embedder(model=db.active_model)
     learner = Learner(embedder, db)
 
     queue.init_queue()
-    while process_next_file(queue, learner, db):
-        pass
+    pool = IngestWorkerPool(queue, learner, db)
+    # Long-lived: wait for new files instead of exiting on an empty queue
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: pool.stop())
+    install_signal_handlers()  # SIGUSR1: toggle slow-op tracing, SIGUSR2: sample profile
+    pool.start()
+    pool.join()
@@ -3,6 +3,7 @@ learn.py — Handles embedding text and storing in ChromaDB using modular classe
 """
 
 from typing import Dict, Any, Optional
+from app.profiling import tracer
 
 class Learner:
     """
@@ -18,29 +19,61 @@ class Learner:
         self.embedder = embedder
         self.db = db
 
+    def sync_model(self) -> Optional[str]:
+        """
+        Point the embedder at the model the database's active collection was
+        built with (a migration may have switched it, possibly in another
+        process). Returns the embedder's model, or None if it has none.
+        """
+        if hasattr(self.db, "refresh"):
+            self.db.refresh()
+        active = getattr(self.db, "active_model", None)
+        if active and hasattr(self.embedder, "model"):
+            self.embedder.model = active
+        return getattr(self.embedder, "model", None)
+
     def learn_text(self, text: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Embed and store the given text + metadata.
         Returns dict with status and new entry ID.
 
+        The entry is tagged with the embedding model; if a migration switches
+        models between the embed and the insert, the database rejects it and
+        the text is embedded again with the new model.
+
         Args:
             text (str): The text to learn/store.
             metadata (dict, optional): Extra metadata for DB.
 
         Returns:
-            dict: { "status": "success"|"error", "id": str or None }
+            dict: { "status": "success"|"error", "id": str or None }, plus
+            "retry_after" (seconds) when the error is an embedding server outage
         """
         if not metadata:
             metadata = {}
         try:
-            embedding = self.embedder.embed(text)
-            if embedding is None:
-                raise Exception("Embedding failed.")
-            entry_id = self.db.add_entry(text, embedding, metadata)
+            for _ in range(2):
+                model = self.sync_model()
+                with tracer.span("embed"):
+                    embedding = self.embedder.embed(text)
+                if embedding is None:
+                    raise Exception("Embedding failed.")
+                if model:
+                    metadata["embedding_model"] = model
+                with tracer.span("chroma.add"):
+                    entry_id = self.db.add_entry(text, embedding, metadata)
+                if entry_id is not None or self.sync_model() == model:
+                    break
             if entry_id is None:
                 raise Exception("DB insert failed.")
             return {"status": "success", "id": entry_id}
         except Exception as e:
             print(f"[LEARN ERROR] {e}")
-            return {"status": "error", "id": None, "error": str(e)}
+            result = {"status": "error", "id": None, "error": str(e)}
+            # Every embedding server is down: tell the caller when to try again
+            outage = getattr(self.embedder, "outage", None)
+            retry_after = outage() if outage is not None else None
+            if retry_after is not None:
+                result["retry_after"] = retry_after
+            return result
 
@@ -1,40 +1,55 @@
 # app/main.py
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Body
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from app.embeddings import Embedder
-from app.db import ChromaDatabase
+from app.throttle import INTERACTIVE
+from app.db import open_database, reshard, RESULT_FIELDS
 from app.learn import Learner
 from app.queue import IngestQueue
 from app.watch_desktop import scan_and_queue
-from app.ingest_files import process_next_file
+from app.workers import IngestWorkerPool
+from app.profiling import profiler, tracer
+from app.migrate import ReembedMigration
+from app.utilities.config import load_config
 
-import threading
-import time
+# Optional: orjson for faster /search serialization
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-app = FastAPI(title="Offline Assistant RAG API")
+
+def _json_response(content) -> Response:
+    """Serialize with orjson when available, skipping FastAPI's jsonable_encoder pass."""
+    if orjson is None:
+        return JSONResponse(content)
+    return Response(orjson.dumps(content), media_type="application/json")
+
+config = load_config()
 
 # --- INIT PIPELINE ---
-embedder = Embedder()
-db = ChromaDatabase()
+db = open_database()
+embedder = Embedder(model=db.active_model)  # model the stored vectors were built with
 learner = Learner(embedder, db)
 queue = IngestQueue()
 
-# --- BACKGROUND QUEUE WORKER ---
-def queue_worker():
-    while True:
-        try:
-            if len(queue) > 0:
-                processed = process_next_file(queue, learner, db)
-                # Optionally log or print progress
-                if not processed:
-                    time.sleep(1)
-            else:
-                time.sleep(1)
-        except Exception as e:
-            print("[Queue Worker Error]", e)
-            time.sleep(2)
-
-threading.Thread(target=queue_worker, daemon=True).start()
+# --- BACKGROUND QUEUE WORKERS ---
+workers = IngestWorkerPool(queue, learner, db)
+migration = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workers.start()
+    yield
+    workers.stop(timeout=30)
+
+app = FastAPI(title="Offline Assistant RAG API", lifespan=lifespan)
+# Compress large responses (e.g. big result sets) for clients that accept gzip
+if config.get("gzip_min_bytes"):
+    app.add_middleware(GZipMiddleware, minimum_size=int(config["gzip_min_bytes"]))
 
 # --- ENDPOINTS ---
 
@@ -47,20 +62,43 @@ def add_entry_endpoint(entry: dict = Body(...)):
     if not text:
         return {"error": "Missing 'text'."}
     metadata = {k: v for k, v in entry.items() if k not in ["text", "embedding", "id"]}
-    result = learner.learn_text(text, metadata)
+    with tracer.trace("add"):
+        result = learner.learn_text(text, metadata)
     return result
 
 @app.post("/search")
 def search_endpoint(query: dict = Body(...)):
     """
     Semantic search over learned entries.
+
+    Optional body keys:
+        n_results (int): number of results (default from config)
+        fields (list): any of id, text, metadata, distance (default: text, metadata, distance)
+        max_text_chars (int): truncate returned text
     """
     q = query.get("query")
     if not q:
         return {"error": "Missing 'query'."}
-    embedding = embedder.embed(q)
-    results = db.query_similar(embedding)
-    return {"results": results}
+    fields = query.get("fields")
+    if fields is not None:
+        if not isinstance(fields, list) or not fields or any(f not in RESULT_FIELDS for f in fields):
+            return {"error": f"'fields' must be a non-empty list of: {', '.join(RESULT_FIELDS)}."}
+    n_results = query.get("n_results", config.get("n_results", 5))
+    if not isinstance(n_results, int) or isinstance(n_results, bool):
+        return {"error": "'n_results' must be an integer."}
+    n_results = max(1, min(n_results, 1000))
+    max_text_chars = query.get("max_text_chars")
+    if max_text_chars is not None:
+        if not isinstance(max_text_chars, int) or isinstance(max_text_chars, bool):
+            return {"error": "'max_text_chars' must be an integer."}
+        max_text_chars = max(0, max_text_chars)
+    with tracer.trace("search", q[:100]):
+        learner.sync_model()  # query with the model the active collection was built with
+        with tracer.span("embed"):
+            embedding = embedder.embed(q, priority=INTERACTIVE)
+        with tracer.span("chroma.query"):
+            results = db.query_similar(embedding, n_results, fields, max_text_chars)
+    return _json_response({"results": results})
 
 @app.post("/learn")
 def learn_endpoint(payload: dict = Body(...)):
@@ -71,18 +109,102 @@ def learn_endpoint(payload: dict = Body(...)):
     metadata = payload.get("metadata", {})
     if not text:
         return {"error": "Missing 'text'"}
-    return learner.learn_text(text, metadata)
+    with tracer.trace("learn"):
+        return learner.learn_text(text, metadata)
 
 @app.post("/scan")
 def run_full_scan():
     """
-    Scan folders and queue new files for background ingestion.
+    Scan folders and queue new files for background ingestion, and put files
+    that used up their retries back in the queue.
     Returns immediately; ingestion happens in the background.
     """
     queue.init_queue()
+    retried = queue.retry_failed()  # give files that ran out of retries another go
     scan_and_queue(queue, db)
     # Do NOT drain the queue here, let the worker do it!
-    return {"status": "queued", "queue_length": len(queue)}
+    return {"status": "queued", "queue_length": len(queue), "retried_failed": retried}
+
+@app.post("/admin/shards/{index}/rebuild")
+def rebuild_shard_endpoint(index: int):
+    """
+    Wipe one Chroma shard and re-queue its files for background ingestion.
+    Only available when chroma_shards > 1.
+    """
+    if not hasattr(db, "rebuild_shard"):
+        return {"error": "Sharding is not enabled."}
+    if not 0 <= index < db.num_shards:
+        return {"error": f"Shard index must be between 0 and {db.num_shards - 1}."}
+    result = db.rebuild_shard(index, queue)
+    return {"status": "rebuilding", "shard": index, **result}
+
+@app.post("/admin/shards/reshard")
+def reshard_endpoint():
+    """
+    Move entries into the current shard layout after changing chroma_shards,
+    chroma_shard_by or chroma_shard_dirs, or turning sharding on/off.
+    """
+    return reshard(db)
+
+@app.post("/admin/profile", response_class=PlainTextResponse)
+def profile_endpoint(payload: dict = Body(default={})):
+    """
+    Sample every thread's stack for N seconds and return flamegraph-compatible
+    collapsed stacks (feed to flamegraph.pl or speedscope).
+    Body: {"seconds": 10, "interval": 0.005}
+    """
+    seconds = min(float(payload.get("seconds", 10)), 300)
+    interval = max(float(payload.get("interval", 0.005)), 0.001)
+    try:
+        return profiler.run(seconds, interval)
+    except RuntimeError as e:
+        return PlainTextResponse(str(e), status_code=409)
+
+@app.post("/admin/trace")
+def trace_config_endpoint(payload: dict = Body(default={})):
+    """
+    Turn slow-operation tracing on/off or change its threshold.
+    Body: {"enabled": true, "threshold_ms": 500, "clear": false}
+    """
+    if payload.get("clear"):
+        tracer.clear()
+    return tracer.configure(payload.get("enabled"), payload.get("threshold_ms"))
+
+@app.get("/admin/traces")
+def traces_endpoint(limit: int = 50, name: str = None):
+    """
+    Recent slow operations (newest first) with per-stage timings.
+    Filter by name: ingest, search, add, learn.
+    """
+    return {"traces": tracer.records(limit=limit, name=name)}
+
+@app.post("/admin/migrate")
+def start_migration_endpoint(payload: dict = Body(...)):
+    """
+    Re-embed every stored document with a new embedding model in the background.
+    /search keeps using the current collection until the copy finishes, then
+    switches over. Rerunning with the same model resumes an interrupted run.
+    Body: {"model": "nomic-embed-text:v1.5"}
+    """
+    global migration
+    model = payload.get("model")
+    if not model:
+        return {"error": "Missing 'model'."}
+    db.refresh()
+    if model == db.active_model:
+        return {"error": f"Already using '{model}'."}
+    if migration is not None and migration.running:
+        return {"error": "A migration is already running.", "status": migration.status}
+    migration = ReembedMigration(db, model, embedder=embedder)
+    migration.start()
+    return {"status": "started", "model": model}
+
+@app.get("/admin/migrate")
+def migration_status_endpoint():
+    """Progress and throughput of the current or last migration."""
+    if migration is None:
+        return {"state": "idle", "model": db.active_model}
+    return migration.status
 
 @app.get("/health")
 def health_check():
@@ -92,8 +214,9 @@ def health_check():
     health = {}
     # LLM health
     try:
-        embedding = embedder.embed("test")
+        embedding = embedder.embed("test", priority=INTERACTIVE)
         health["embedding_server"] = "ok" if embedding is not None else "fail"
+        health["embedding_load"] = embedder.stats()
     except Exception as e:
         health["embedding_server"] = f"fail: {e}"
     # Chroma health
@@ -107,6 +230,8 @@ def health_check():
         queue.init_queue()
         qlen = len(queue)
         health["queue"] = f"processing ({qlen} files)" if qlen > 0 else "idle"
+        health["queue_failed"] = queue.counts().get("failed", 0)
+        health["workers"] = workers.num_workers if workers.running else 0
     except Exception as e:
         health["queue"] = f"fail: {e}"
     return health
@@ -0,0 +1,214 @@
+# app/migrate.py
+
+"""
+migrate.py — Re-embeds stored documents when switching embedding models.
+
+Documents are streamed out of the active collection in pages, re-embedded
+in large batches with the new model and upserted into a new versioned
+collection ("<collection>__<model>"). The old collection keeps serving
+/search until everything is copied; then every shard is switched over
+together and the live embedder starts using the new model.
+
+Progress is checkpointed to <chroma_db_path>/migration__<model>.json, so an
+interrupted run resumes where it stopped.
+
+Run from the API (POST /admin/migrate) or from the CLI (python -m app.migrate
+<model>). The switch is recorded in active_collections.json, which every
+ChromaDatabase re-checks before writes and queries, so a running API or
+ingest worker moves to the new collection and model without a restart.
+Copied entries are tagged with metadata["embedding_model"]; writes embedded
+with the old model are rejected after the switch and re-embedded by Learner,
+and anything that still reached the old collection during the
+migration_grace_seconds window is caught up before the migration finishes.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from app.embeddings import Embedder
+from app.utilities.config import load_config
+
+
+def versioned_name(collection_name: str, model: str) -> str:
+    """Chroma-safe collection name for `collection_name` built with `model`."""
+    slug = re.sub(r"[^a-zA-Z0-9_-]+", "_", model).strip("_-") or "model"
+    return f"{collection_name}__{slug}"[:63].rstrip("_-")
+
+
+class ReembedMigration:
+    """
+    Copies every document into a collection embedded with `new_model`,
+    then atomically switches the database (and live embedder) over.
+    """
+
+    def __init__(self,
+                 db,
+                 new_model: str,
+                 embedder: Optional[Embedder] = None,
+                 page_size: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None):
+        """
+        Args:
+            db: A ChromaDatabase or ShardedChromaDatabase.
+            new_model (str): Embedding model to migrate to.
+            embedder (Embedder, optional): The live embedder; its endpoints and limiter
+                are reused (so re-embedding shares the ingest budget and /search keeps
+                priority) and its model is switched once the migration completes.
+            page_size (int, optional): Documents read and re-embedded per page.
+            checkpoint_path (str, optional): Where to store resume state.
+        """
+        config = load_config()
+        self.db = db
+        self.shards = getattr(db, "shards", [db])
+        self.new_model = new_model
+        self.live_embedder = embedder
+        urls = embedder.urls if embedder is not None else None
+        limiter = embedder.limiter if embedder is not None else None
+        self.embedder = Embedder(url=urls, model=new_model, limiter=limiter)
+        self.page_size = int(page_size or config.get("migration_page_size", 256))
+        self.grace_seconds = float(config.get("migration_grace_seconds", 2))
+        slug = versioned_name("migration", new_model)
+        self.checkpoint_path = checkpoint_path or os.path.join(str(db.db_path), f"{slug}.json")
+
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {
+            "state": "idle",
+            "model": new_model,
+            "copied": 0,
+            "total": 0,
+            "items_per_sec": 0.0,
+            "elapsed": 0.0,
+            "error": None,
+        }
+
+    # --- checkpointing ---
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("model") == self.new_model:
+                return checkpoint
+        except FileNotFoundError:
+            pass
+        return {"model": self.new_model, "offsets": {}}
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # --- copying ---
+
+    def _copy(self, target, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        """Re-embed one page and upsert it into the target collection."""
+        rows = [(i, d, m) for i, d, m in zip(ids, documents, metadatas) if d]
+        if not rows:
+            return 0
+        embeddings = self.embedder.embed([d for _, d, _ in rows])
+        if embeddings is None or len(embeddings) != len(rows):
+            raise RuntimeError("Re-embedding failed; rerun to resume from the last checkpoint.")
+        target.upsert(
+            ids=[i for i, _, _ in rows],
+            documents=[d for _, d, _ in rows],
+            metadatas=[dict(m or {}, embedding_model=self.new_model) for _, _, m in rows],
+            embeddings=embeddings,
+        )
+        return len(rows)
+
+    def _progress(self, copied: int, started: float, base: int) -> None:
+        elapsed = time.monotonic() - started
+        self.status["copied"] = copied
+        self.status["elapsed"] = round(elapsed, 1)
+        self.status["items_per_sec"] = round((copied - base) / elapsed, 2) if elapsed else 0.0
+
+    def _catch_up(self, source, target) -> int:
+        """Copy entries written to the source after they were paged past."""
+        missing = sorted(set(source.get(include=[])["ids"]) - set(target.get(include=[])["ids"]))
+        copied = 0
+        for start in range(0, len(missing), self.page_size):
+            page = source.get(ids=missing[start:start + self.page_size], include=["documents", "metadatas"])
+            copied += self._copy(target, page["ids"], page["documents"], page["metadatas"])
+        return copied
+
+    def run(self) -> Dict[str, Any]:
+        """Run (or resume) the migration to completion. Returns the final status."""
+        started = time.monotonic()
+        self.status.update(state="running", error=None)
+        try:
+            checkpoint = self._load_checkpoint()
+            targets = []
+            for shard in self.shards:
+                name = versioned_name(shard.collection_name, self.new_model)
+                targets.append(shard.client.get_or_create_collection(name))
+            self.status["total"] = sum(shard.collection.count() for shard in self.shards)
+            copied = base = sum(t.count() for t in targets)
+            self.status["copied"] = copied
+
+            for index, (shard, target) in enumerate(zip(self.shards, targets)):
+                self.status["shard"] = index
+                source = shard.collection
+                offset = checkpoint["offsets"].get(str(index), 0)
+                while True:
+                    page = source.get(limit=self.page_size, offset=offset,
+                                      include=["documents", "metadatas"])
+                    if not page["ids"]:
+                        break
+                    self._copy(target, page["ids"], page["documents"], page["metadatas"])
+                    offset += len(page["ids"])
+                    checkpoint["offsets"][str(index)] = offset
+                    self._save_checkpoint(checkpoint)
+                    copied = sum(t.count() for t in targets)
+                    self._progress(copied, started, base)
+                    print(f"[MIGRATE] shard {index}: {copied}/{self.status['total']} "
+                          f"({self.status['items_per_sec']}/s)")
+                self._catch_up(source, target)
+
+            # Switch the embedder and every shard together while no write is
+            # in flight, give other processes time to notice the new pointer,
+            # then re-embed anything written to the old collections meanwhile
+            old_collections = [shard.collection for shard in self.shards]
+            with self.db.switch_lock:
+                if self.live_embedder is not None:
+                    self.live_embedder.model = self.new_model
+                for shard, target in zip(self.shards, targets):
+                    shard.switch_collection(target.name, self.new_model)
+            time.sleep(self.grace_seconds)
+            for old, target in zip(old_collections, targets):
+                self._catch_up(old, target)
+
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            self._progress(sum(t.count() for t in targets), started, base)
+            self.status["state"] = "done"
+            print(f"[MIGRATE] Switched to {self.new_model}: {self.status['copied']} entries")
+        except Exception as e:
+            self.status.update(state="failed", error=str(e))
+            print(f"[MIGRATE ERROR] {e}")
+        return self.status
+
+    def start(self) -> None:
+        """Run the migration in a background thread."""
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self.run, name="reembed-migration", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+if __name__ == "__main__":
+    from app.db import open_database
+
+    if len(sys.argv) != 2:
+        print("Usage: python -m app.migrate <new_embedding_model>")
+        sys.exit(1)
+    status = ReembedMigration(open_database(), sys.argv[1]).run()
+    sys.exit(0 if status["state"] == "done" else 1)
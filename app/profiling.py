@@ -0,0 +1,240 @@
+# app/profiling.py
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+from app.utilities.config import load_config
+
+_NULL = nullcontext()
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for every thread in the process.
+
+    run() samples all thread stacks every `interval` seconds and returns them
+    in collapsed "frame;frame;frame count" form, ready for flamegraph.pl or
+    speedscope. Nothing runs between calls, so there is no cost when idle.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+    def run(self, seconds: float, interval: float = 0.005) -> str:
+        """
+        Sample for `seconds` and return collapsed stacks.
+        Raises RuntimeError if another profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running.")
+        try:
+            me = threading.get_ident()
+            names = {}
+            counts = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frames = sys._current_frames()
+                if len(names) != len(frames):
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return "\n".join(f"{stack} {n}" for stack, n in counts.most_common())
+        finally:
+            self._lock.release()
+
+
+class _Trace:
+    """Timing breakdown for one file or request."""
+
+    __slots__ = ("name", "key", "started", "start", "spans")
+
+    def __init__(self, name: str, key: Optional[str]):
+        self.name = name
+        self.key = key
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: _Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.trace.spans[self.name] = self.trace.spans.get(self.name, 0.0) + elapsed
+        return False
+
+
+class SlowOpTracer:
+    """
+    Records a per-stage timing breakdown for any file or request slower than
+    threshold_ms, in a bounded ring buffer.
+
+    Usage:
+        with tracer.trace("ingest", path):
+            with tracer.span("embed"):
+                ...
+
+    When disabled, trace() and span() return a shared no-op context manager
+    after a single attribute check, so instrumentation can stay in hot paths.
+    """
+
+    def __init__(self, enabled: bool = False, threshold_ms: float = 1000, capacity: int = 200):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self._records = deque(maxlen=capacity)
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "SlowOpTracer":
+        """Build a tracer from the trace_* keys in config.yaml."""
+        return cls(
+            enabled=bool(config.get("trace_enabled", False)),
+            threshold_ms=float(config.get("trace_threshold_ms", 1000)),
+            capacity=int(config.get("trace_capacity", 200)),
+        )
+
+    def configure(self, enabled: Optional[bool] = None, threshold_ms: Optional[float] = None) -> Dict[str, Any]:
+        """Toggle tracing or change the threshold at runtime. Returns the new state."""
+        if threshold_ms is not None:
+            self.threshold_ms = float(threshold_ms)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        return {"enabled": self.enabled, "threshold_ms": self.threshold_ms,
+                "recorded": len(self._records)}
+
+    def trace(self, name: str, key: Optional[str] = None):
+        if not self.enabled:
+            return _NULL
+        return _TraceContext(self, name, key)
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL
+        current = getattr(self._local, "current", None)
+        if current is None:
+            return _NULL
+        return _Span(current, name)
+
+    def set_key(self, key: str) -> None:
+        """Attach a key (e.g. file path) to the trace running on this thread."""
+        current = getattr(self._local, "current", None) if self.enabled else None
+        if current is not None:
+            current.key = key
+
+    def _finish(self, trace: _Trace, error: Optional[BaseException]) -> None:
+        total_ms = (time.perf_counter() - trace.start) * 1000
+        if total_ms < self.threshold_ms:
+            return
+        spans = {k: round(v * 1000, 2) for k, v in trace.spans.items()}
+        spans["other"] = round(max(0.0, total_ms - sum(spans.values())), 2)
+        self._records.append({
+            "name": trace.name,
+            "key": trace.key,
+            "started": trace.started,
+            "total_ms": round(total_ms, 2),
+            "spans_ms": spans,
+            "thread": threading.current_thread().name,
+            "error": repr(error) if error else None,
+        })
+
+    def records(self, limit: Optional[int] = None, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent slow operations first."""
+        snapshot = list(self._records)  # copied in one C call, safe while workers append
+        records = [r for r in reversed(snapshot) if name is None or r["name"] == name]
+        return records[:limit] if limit else records
+
+    def clear(self) -> None:
+        self._records.clear()
+
+
+class _TraceContext:
+    __slots__ = ("tracer", "trace", "previous")
+
+    def __init__(self, tracer: SlowOpTracer, name: str, key: Optional[str]):
+        self.tracer = tracer
+        self.trace = _Trace(name, key)
+
+    def __enter__(self):
+        self.previous = getattr(self.tracer._local, "current", None)
+        self.tracer._local.current = self.trace
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._local.current = self.previous
+        self.tracer._finish(self.trace, exc)
+        return False
+
+
+# Process-wide instances, shared by the API and CLI workers
+_config = load_config()
+profiler = SamplingProfiler()
+tracer = SlowOpTracer.from_config(_config)
+
+
+def install_signal_handlers(out_dir: Optional[str] = None, profile_seconds: Optional[float] = None):
+    """
+    Runtime profiling for CLI workers (POSIX only):
+        - SIGUSR1 toggles the slow-operation tracer; turning it off writes
+          the recorded traces to slow-ops-<pid>.json
+        - SIGUSR2 runs the sampling profiler in the background and writes
+          profile-<pid>-<time>.folded
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    out_dir = out_dir or _config.get("profile_dir", ".")
+    seconds = float(profile_seconds or _config.get("profile_seconds", 30))
+
+    def toggle_tracer(*_):
+        tracer.configure(enabled=not tracer.enabled)
+        print(f"[PROFILE] Slow-op tracing {'enabled' if tracer.enabled else 'disabled'}")
+        if not tracer.enabled:
+            path = os.path.join(out_dir, f"slow-ops-{os.getpid()}.json")
+            with open(path, "w") as f:
+                json.dump(tracer.records(), f, indent=2)
+            print(f"[PROFILE] Wrote {path}")
+
+    def run_profile():
+        try:
+            stacks = profiler.run(seconds)
+        except RuntimeError as e:
+            print(f"[PROFILE] {e}")
+            return
+        path = os.path.join(out_dir, f"profile-{os.getpid()}-{int(time.time())}.folded")
+        with open(path, "w") as f:
+            f.write(stacks + "\n")
+        print(f"[PROFILE] Wrote {path}")
+
+    def start_profile(*_):
+        print(f"[PROFILE] Sampling for {seconds:.0f}s")
+        threading.Thread(target=run_profile, name="profiler", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, toggle_tracer)
+    signal.signal(signal.SIGUSR2, start_profile)
@@ -2,13 +2,27 @@
 
 import sqlite3
 import os
-from typing import Optional
+import threading
+import time
+from typing import Dict, Optional
 from app.utilities.config import load_config
 
 class IngestQueue:
     """
     A modular, SQLite-backed queue for ingest jobs. 
     Reads DB location from config or environment, with full error handling.
+
+    Failed files are not dropped: mark_failed() moves them to 'retry' with
+    exponential backoff, and to 'failed' once max_retries is exhausted.
+    retry_failed() (run by /scan) puts 'failed' files back to 'pending'.
+    Failures caused by an embedding server outage go through defer(), which
+    doesn't use up an attempt and pauses claims until the outage may be over.
+
+    Workers block in wait_for_work() instead of polling. Enqueues in this
+    process wake them immediately through a condition variable. While anyone
+    is waiting, a single watcher thread per queue checks SQLite's data_version
+    every poll_interval (commits from other connections or processes) and
+    wakes the waiters when that changes or a scheduled retry comes due.
     """
 
     def __init__(self, db_path: Optional[str] = None):
@@ -16,11 +30,103 @@ class IngestQueue:
         self.db_path = db_path or os.environ.get(
             "QUEUE_DB", config.get("queue_db", "ingest_queue.sqlite3")
         )
+        self.max_retries = int(config.get("ingest_max_retries", 5))
+        self.retry_backoff = float(config.get("ingest_retry_backoff", 30))  # seconds
+        self.retry_backoff_max = float(config.get("ingest_retry_backoff_max", 3600))
+        self.poll_interval = float(config.get("queue_poll_interval", 0.25))  # seconds
+        self.claim_timeout = float(config.get("queue_claim_timeout", 600))  # seconds
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._watch_conn = None
+        self._data_version = None
+        self._waiters = 0
+        self._watcher: Optional[threading.Thread] = None
+        self._paused_until = 0.0  # time.time() until which get_next_file() claims nothing
         self.init_queue()
+        self._external_change()  # record the starting data_version
 
     def _connect(self):
         return sqlite3.connect(self.db_path)
 
+    @property
+    def generation(self) -> int:
+        """Counter bumped on every wake-up; pass it to wait_for_work()."""
+        return self._generation
+
+    def notify(self):
+        """Wake every thread blocked in wait_for_work()."""
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def _external_change(self) -> bool:
+        """True if another connection/process has committed since the last check."""
+        try:
+            if self._watch_conn is None:
+                self._watch_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        except Exception as e:
+            print(f"[QUEUE ERROR] data_version check failed: {e}")
+            return False
+        changed = self._data_version is not None and version != self._data_version
+        self._data_version = version
+        return changed
+
+    def _next_retry_delay(self) -> Optional[float]:
+        """Seconds until the earliest scheduled retry, claim expiry or pause end is due, or None."""
+        pause = self._paused_until - time.time()
+        if pause > 0:
+            return pause
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT MIN(CASE WHEN status='retry' THEN next_attempt "
+                "ELSE COALESCE(claimed_at, 0) + ? END) "
+                "FROM files WHERE status IN ('retry', 'processing')",
+                (self.claim_timeout,)
+            ).fetchone()
+            return None if row[0] is None else max(0.0, row[0] - time.time())
+        except Exception as e:
+            print(f"[QUEUE ERROR] Failed to read retry schedule: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def _next_due(self) -> Optional[float]:
+        delay = self._next_retry_delay()
+        return None if delay is None else time.monotonic() + delay
+
+    def _watch(self):
+        """Watcher thread: runs while anyone is in wait_for_work(), then exits."""
+        seen, due = self._generation, self._next_due()
+        while True:
+            with self._cond:
+                if not self._waiters:
+                    self._watcher = None
+                    return
+            time.sleep(self.poll_interval)
+            changed = self._external_change()
+            if changed or (due is not None and time.monotonic() >= due):
+                self.notify()
+            if self._generation != seen:
+                seen, due = self._generation, self._next_due()
+
+    def wait_for_work(self, seen_generation: int, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the queue may have work for a caller that last looked at
+        `seen_generation`: an enqueue in this process, a commit from another
+        process, a scheduled retry coming due, or notify(). Returns False on timeout.
+        """
+        with self._cond:
+            self._waiters += 1
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="queue-watcher", daemon=True)
+                self._watcher.start()
+            try:
+                return self._cond.wait_for(lambda: self._generation != seen_generation, timeout)
+            finally:
+                self._waiters -= 1
+
     def init_queue(self):
         """Initialize the queue table if it doesn't exist."""
         try:
@@ -33,6 +139,16 @@ class IngestQueue:
                     status TEXT DEFAULT 'pending'
                 )
             ''')
+            # Retry bookkeeping, added after the original schema
+            existing = {row[1] for row in c.execute("PRAGMA table_info(files)")}
+            for column, decl in (
+                ("attempts", "INTEGER DEFAULT 0"),
+                ("next_attempt", "REAL DEFAULT 0"),
+                ("last_error", "TEXT"),
+                ("claimed_at", "REAL"),
+            ):
+                if column not in existing:
+                    c.execute(f"ALTER TABLE files ADD COLUMN {column} {decl}")
             conn.commit()
         except Exception as e:
             print(f"[QUEUE ERROR] Failed to initialize queue: {e}")
@@ -46,27 +162,70 @@ class IngestQueue:
             c = conn.cursor()
             c.execute("INSERT OR IGNORE INTO files (path) VALUES (?)", (path,))
             conn.commit()
+            self.notify()
         except Exception as e:
             print(f"[QUEUE ERROR] Failed to add '{path}': {e}")
         finally:
             conn.close()
 
+    def requeue(self, path: str):
+        """Add a file to the queue, resetting it to 'pending' even if already processed."""
+        try:
+            conn = self._connect()
+            c = conn.cursor()
+            c.execute(
+                "INSERT INTO files (path) VALUES (?) "
+                "ON CONFLICT(path) DO UPDATE SET status='pending', attempts=0, next_attempt=0, last_error=NULL",
+                (path,)
+            )
+            conn.commit()
+            self.notify()
+        except Exception as e:
+            print(f"[QUEUE ERROR] Failed to requeue '{path}': {e}")
+        finally:
+            conn.close()
+
     def get_next_file(self) -> Optional[str]:
         """
-        Get the next pending file and mark as 'processing'.
+        Get the next pending file (or a retry whose backoff has expired)
+        and mark as 'processing'. Fresh files are served before retries.
         Returns None if queue is empty.
+        Safe to call from several workers/processes at once.
+
+        A 'processing' claim older than claim_timeout (worker stopped mid-file
+        or process crashed) is treated as pending again.
+        Returns None while claims are paused by defer().
         """
+        if time.time() < self._paused_until:
+            return None
         try:
             conn = self._connect()
             c = conn.cursor()
-            c.execute("SELECT path FROM files WHERE status='pending' LIMIT 1")
-            row = c.fetchone()
-            if row:
+            claimable = (
+                "(status='pending' OR (status='retry' AND next_attempt <= :now) "
+                "OR (status='processing' AND COALESCE(claimed_at, 0) <= :stale))"
+            )
+            while True:
+                now = time.time()
+                params = {"now": now, "stale": now - self.claim_timeout}
+                c.execute(
+                    f"SELECT path FROM files WHERE {claimable} "
+                    "ORDER BY status='retry', id LIMIT 1",
+                    params
+                )
+                row = c.fetchone()
+                if not row:
+                    return None
                 path = row[0]
-                c.execute("UPDATE files SET status='processing' WHERE path=?", (path,))
+                # Only claim it if no other worker got there first
+                c.execute(
+                    f"UPDATE files SET status='processing', claimed_at=:now "
+                    f"WHERE path=:path AND {claimable}",
+                    dict(params, path=path)
+                )
                 conn.commit()
-                return path
-            return None
+                if c.rowcount:
+                    return path
         except Exception as e:
             print(f"[QUEUE ERROR] Failed to get next file: {e}")
             return None
@@ -85,14 +244,90 @@ class IngestQueue:
         finally:
             conn.close()
 
+    def mark_failed(self, path: str, error: Optional[str] = None):
+        """
+        Record a failed attempt for the given file.
+        Schedules a retry with exponential backoff, or marks it 'failed'
+        once max_retries attempts have been used.
+        """
+        try:
+            conn = self._connect()
+            c = conn.cursor()
+            c.execute("SELECT attempts FROM files WHERE path=?", (path,))
+            row = c.fetchone()
+            attempts = (row[0] or 0) + 1 if row else 1
+            if attempts >= self.max_retries:
+                status, next_attempt = "failed", 0
+            else:
+                delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_backoff_max)
+                status, next_attempt = "retry", time.time() + delay
+            c.execute(
+                "UPDATE files SET status=?, attempts=?, next_attempt=?, last_error=? WHERE path=?",
+                (status, attempts, next_attempt, error, path)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"[QUEUE ERROR] Failed to mark '{path}' as failed: {e}")
+        finally:
+            conn.close()
+
+    def defer(self, path: str, delay: float, error: Optional[str] = None):
+        """
+        Put a file back for another try in `delay` seconds without using up an
+        attempt, and pause claims in this process for as long: the embedding
+        servers are down, so every other file would fail the same way.
+        """
+        self._paused_until = max(self._paused_until, time.time() + delay)
+        try:
+            conn = self._connect()
+            c = conn.cursor()
+            c.execute(
+                "UPDATE files SET status='retry', next_attempt=?, last_error=? WHERE path=?",
+                (time.time() + delay, error, path)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"[QUEUE ERROR] Failed to defer '{path}': {e}")
+        finally:
+            conn.close()
+
+    def retry_failed(self) -> int:
+        """Reset every 'failed' file to 'pending' with fresh attempts. Returns how many."""
+        try:
+            conn = self._connect()
+            c = conn.cursor()
+            c.execute(
+                "UPDATE files SET status='pending', attempts=0, next_attempt=0 WHERE status='failed'"
+            )
+            conn.commit()
+            if c.rowcount:
+                self.notify()
+            return c.rowcount
+        except Exception as e:
+            print(f"[QUEUE ERROR] Failed to reset failed files: {e}")
+            return 0
+        finally:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        """Number of files per status (pending, processing, retry, done, failed)."""
+        try:
+            conn = self._connect()
+            return dict(conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+        except Exception as e:
+            print(f"[QUEUE ERROR] Failed to count files: {e}")
+            return {}
+        finally:
+            conn.close()
+
     def __len__(self):
         """
-        Return the number of files in the queue with status 'pending' or 'processing'.
+        Return the number of files in the queue with status 'pending', 'processing' or 'retry'.
         """
         try:
             conn = self._connect()
             c = conn.cursor()
-            c.execute("SELECT COUNT(*) FROM files WHERE status IN ('pending', 'processing')")
+            c.execute("SELECT COUNT(*) FROM files WHERE status IN ('pending', 'processing', 'retry')")
             count = c.fetchone()[0]
             return count
         except Exception as e:
@@ -116,5 +351,8 @@ try:
 
     def mark_done(path):
         _queue.mark_done(path)
+
+    def mark_failed(path, error=None):
+        _queue.mark_failed(path, error)
 except Exception:
     pass
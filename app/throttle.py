@@ -0,0 +1,189 @@
+# app/throttle.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class AdaptiveLimiter:
+    """
+    AIMD controller for requests to the embedding server.
+
+    Tunes two knobs from observed latency and errors:
+        - limit: how many embedding requests may be in flight at once
+        - batch_size: how many texts go into one batched request
+          (used by list embeds such as migration re-embedding)
+
+    Ingest worker pools size themselves from max_concurrency and use
+    wait_for_capacity() so only `limit` workers are active at a time.
+
+    Healthy responses (under target_latency) grow both additively; slow
+    responses or errors cut both in half. Interactive callers (e.g. /search)
+    are always admitted ahead of background ingest and get a small reserve
+    above the limit so they never queue behind a saturated ingest.
+    """
+
+    def __init__(
+        self,
+        min_concurrency: int = 1,
+        max_concurrency: int = 8,
+        initial_concurrency: int = 2,
+        min_batch: int = 1,
+        max_batch: int = 64,
+        initial_batch: int = 8,
+        target_latency: float = 2.0,
+        interactive_reserve: int = 1,
+    ):
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.target_latency = target_latency
+        self.interactive_reserve = interactive_reserve
+
+        self._limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self._batch = float(min(max(initial_batch, self.min_batch), self.max_batch))
+        self._in_flight = 0
+        self._waiting_interactive = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+        # Smoothed stats, exposed via stats()
+        self._avg_latency: Optional[float] = None
+        self._error_rate = 0.0
+        self._completed = 0
+        self._errors = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], scale: int = 1) -> "AdaptiveLimiter":
+        """
+        Build a limiter from the embedding_* keys in config.yaml.
+        Concurrency bounds are per server; scale multiplies them by the endpoint count.
+        """
+        return cls(
+            min_concurrency=int(config.get("embedding_min_concurrency", 1)) * scale,
+            max_concurrency=int(config.get("embedding_max_concurrency", 8)) * scale,
+            initial_concurrency=int(config.get("embedding_initial_concurrency", 2)) * scale,
+            min_batch=int(config.get("embedding_min_batch", 1)),
+            max_batch=int(config.get("embedding_max_batch", 64)),
+            initial_batch=int(config.get("embedding_initial_batch", 8)),
+            target_latency=float(config.get("embedding_target_latency", 2.0)),
+        )
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def batch_size(self) -> int:
+        return int(self._batch)
+
+    def acquire(self, priority: str = BACKGROUND, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for an in-flight slot. Returns False if timeout expires first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._waiting_interactive += 1
+            try:
+                while not self._can_admit(priority):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._in_flight += 1
+                return True
+            finally:
+                if priority == INTERACTIVE:
+                    self._waiting_interactive -= 1
+
+    def wait_for_capacity(self, index: int, timeout: Optional[float] = None,
+                          cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Block until the limit allows more than `index` concurrent requests.
+        Ingest worker `index` calls this before claiming a file, so the number
+        of active workers follows the limit. Woken by release() as the limit
+        changes, or by wake() once `cancelled()` is true.
+        Returns False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.limit > index or (cancelled is not None and cancelled()), timeout
+            )
+
+    def wake(self) -> None:
+        """Wake every thread blocked in wait_for_capacity() to re-check its condition."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def _can_admit(self, priority: str) -> bool:
+        if priority == INTERACTIVE:
+            return self._in_flight < self.limit + self.interactive_reserve
+        return self._waiting_interactive == 0 and self._in_flight < self.limit
+
+    def release(self, latency: float, ok: bool) -> None:
+        """Free a slot and feed the observed latency/outcome into the controller."""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._record(latency, ok)
+            self._cond.notify_all()
+
+    def _record(self, latency: float, ok: bool) -> None:
+        self._completed += 1
+        if not ok:
+            self._errors += 1
+        self._error_rate = 0.9 * self._error_rate + 0.1 * (0.0 if ok else 1.0)
+        if ok:
+            self._avg_latency = latency if self._avg_latency is None else (
+                0.8 * self._avg_latency + 0.2 * latency
+            )
+
+        if ok and latency <= self.target_latency:
+            # Additive increase: roughly +1 slot per window of `limit` successes
+            self._limit = min(self.max_concurrency, self._limit + 1.0 / max(self._limit, 1.0))
+            self._batch = min(self.max_batch, self._batch + 1)
+            return
+
+        # Multiplicative decrease, at most once per target_latency window so a
+        # burst of slow responses from the same overload only backs off once.
+        now = time.monotonic()
+        if now - self._last_decrease < self.target_latency:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_concurrency, self._limit / 2)
+        self._batch = max(self.min_batch, self._batch / 2)
+
+    @contextmanager
+    def slot(self, priority: str = BACKGROUND):
+        """
+        Context manager around a single embedding request.
+        Yields a dict; set result["ok"] = False on failure before exiting.
+        """
+        self.acquire(priority)
+        result = {"ok": True}
+        start = time.monotonic()
+        try:
+            yield result
+        except Exception:
+            result["ok"] = False
+            raise
+        finally:
+            self.release(time.monotonic() - start, result["ok"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of controller state for health/debugging."""
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "batch_size": self.batch_size,
+                "in_flight": self._in_flight,
+                "avg_latency": self._avg_latency,
+                "error_rate": round(self._error_rate, 3),
+                "completed": self._completed,
+                "errors": self._errors,
+            }
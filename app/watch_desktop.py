@@ -3,7 +3,7 @@
 import os
 from app.utilities.config import load_config
 from app.queue import IngestQueue
-from app.db import ChromaDatabase
+from app.db import ChromaDatabase, open_database
 from app.utilities.files import get_file_metadata, file_key
 
 def should_skip_file(path, skip_exts):
@@ -39,7 +39,7 @@ def scan_and_queue(queue: IngestQueue, db: ChromaDatabase):
 
 if __name__ == "__main__":
     queue = IngestQueue()
-    db = ChromaDatabase()
+    db = open_database()
     queue.init_queue()
     scan_and_queue(queue, db)
     print("[QUEUE] Scan complete.")
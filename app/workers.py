@@ -0,0 +1,95 @@
+# app/workers.py
+
+import threading
+from typing import List, Optional
+from app.ingest_files import process_next_file
+from app.utilities.config import load_config
+
+class IngestWorkerPool:
+    """
+    Long-lived pool of ingest worker threads.
+
+    Each worker drains the queue and then blocks in queue.wait_for_work()
+    until something is enqueued, so idle workers cost almost nothing and
+    new files are picked up immediately. stop() wakes and joins them.
+
+    When the learner's embedder has an AdaptiveLimiter, only the first
+    `limiter.limit` workers claim files; the rest park until the limit grows,
+    so ingest concurrency follows the controller.
+    """
+
+    def __init__(self, queue, learner, db, num_workers: Optional[int] = None):
+        """
+        Args:
+            queue: An IngestQueue (must have .wait_for_work(), .notify(), .generation)
+            learner: A Learner instance
+            db: A database instance
+            num_workers (int, optional): Thread count. Defaults to ingest_workers per
+                embedding endpoint, else the limiter's max concurrency (also per endpoint).
+        """
+        config = load_config()
+        self.queue = queue
+        self.learner = learner
+        self.db = db
+        self.limiter = getattr(getattr(learner, "embedder", None), "limiter", None)
+        # Per embedding endpoint, like the limiter's concurrency bounds
+        endpoints = len(getattr(getattr(learner, "embedder", None), "pool", None) or [None])
+        if config.get("ingest_workers"):
+            default = int(config["ingest_workers"]) * endpoints
+        else:
+            default = self.limiter.max_concurrency if self.limiter is not None else 2
+        self.num_workers = int(num_workers or default)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Start the worker threads (no-op if already running)."""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._run, args=(i,), name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"[WORKERS] Started {self.num_workers} ingest workers")
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Ask workers to exit after their current file and wait for them.
+        A file still unfinished when the timeout expires stays claimed and is
+        picked up again once the queue's claim_timeout passes.
+        """
+        self._stop.set()
+        self.queue.notify()
+        if self.limiter is not None:
+            self.limiter.wake()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        print("[WORKERS] Stopped")
+
+    def join(self):
+        """Block until the pool is stopped (e.g. from a signal handler)."""
+        while not self._stop.wait(1):
+            pass
+        for t in self._threads:
+            t.join()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads) and not self._stop.is_set()
+
+    def _run(self, index: int):
+        while not self._stop.is_set():
+            try:
+                if self.limiter is not None:
+                    # Parked until the limiter allows this many workers (or stop())
+                    self.limiter.wait_for_capacity(index, cancelled=self._stop.is_set)
+                    if self._stop.is_set():
+                        break
+                seen = self.queue.generation
+                if not process_next_file(self.queue, self.learner, self.db):
+                    self.queue.wait_for_work(seen)
+            except Exception as e:
+                print("[Queue Worker Error]", e)
+                self._stop.wait(2)
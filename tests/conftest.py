@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+
+class StubDB:
+    """Database stand-in for ingest tests: nothing is learned yet, every add succeeds."""
+    def file_already_learned(self, key):
+        return False
+
+    def add_entry(self, text, embedding, metadata, entry_id=None):
+        return "id"
+
+
+@pytest.fixture
+def ingest(tmp_path):
+    """
+    Run files through a real IngestQueue + IngestWorkerPool.
+
+    ingest(num_files, embedder=..., learner=..., num_workers=..., name=...)
+    starts the pool, enqueues num_files notes, waits for the queue to drain
+    and stops the pool. Returns (pool, elapsed seconds). Pass a different
+    `name` to run several ingests in one test.
+    """
+    from app.learn import Learner
+    from app.queue import IngestQueue
+    from app.workers import IngestWorkerPool
+
+    def run(num_files, embedder=None, learner=None, num_workers=None, name="ingest", timeout=30):
+        folder = tmp_path / name
+        folder.mkdir()
+        queue = IngestQueue(db_path=str(folder / "queue.sqlite3"))
+        learner = learner or Learner(embedder, StubDB())
+        pool = IngestWorkerPool(queue, learner, StubDB(), num_workers=num_workers)
+        start = time.monotonic()
+        pool.start()
+        try:
+            for i in range(num_files):
+                note = folder / f"note{i}.txt"
+                note.write_text(f"note {i}")
+                queue.add_to_queue(str(note))
+            while len(queue) and time.monotonic() - start < timeout:
+                time.sleep(0.01)
+            elapsed = time.monotonic() - start
+            assert len(queue) == 0
+        finally:
+            pool.stop(timeout=5)
+        return pool, elapsed
+
+    return run
+
+
+@pytest.fixture
+def stub_db():
+    return StubDB()
@@ -1,7 +1,8 @@
 import pytest
 
-from app.db import ChromaDatabase
+from app.db import ChromaDatabase, ShardedChromaDatabase, reshard
 from app.learn import Learner
+from app.queue import IngestQueue
 
 # --- Metadata helper ---
 def make_chroma_metadata(meta: dict) -> dict:
@@ -48,3 +49,122 @@ def test_learn_pipeline(tmp_path):
     found = db.query_similar(vec)
     assert found
     assert any("hydroponics" in r["metadata"].get("tags", "") for r in found)
+
+def test_sharded_query_merges_across_shards(tmp_path):
+    db = ShardedChromaDatabase(num_shards=3, db_path=str(tmp_path / "sharded"))
+    for i in range(12):
+        vec = [float(i)] + [0.0] * 7
+        db.add_entry(f"note {i}", vec, {"file_key": f"key-{i}", "path": f"/tmp/f{i}.txt"})
+    assert sum(1 for s in db.shards if s.all_entry_ids()) > 1
+    results = db.query_similar([0.0] * 8, n_results=3)
+    assert [r["text"] for r in results] == ["note 0", "note 1", "note 2"]
+    assert db.file_already_learned("key-5")
+    assert not db.file_already_learned("key-missing")
+
+def test_rebuild_shard_requeues_its_files(tmp_path):
+    db = ShardedChromaDatabase(num_shards=2, db_path=str(tmp_path / "sharded2"))
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    for i in range(6):
+        db.add_entry(f"note {i}", [float(i)] * 4, {"file_key": f"key-{i}", "path": f"/tmp/f{i}.txt"})
+    before = len(db.shards[0].all_entry_ids())
+    assert db.rebuild_shard(0, queue) == {"requeued": before, "kept": 0}
+    assert db.shards[0].all_entry_ids() == []
+    assert len(db.shards[1].all_entry_ids()) == 6 - before
+    assert len(queue) == before
+
+def test_rebuild_shard_keeps_notes_without_path(tmp_path):
+    db = ShardedChromaDatabase(num_shards=2, db_path=str(tmp_path / "sharded4"))
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    db.add_entry("file", [1.0] * 4, {"file_key": "k", "path": "/tmp/f.txt"}, entry_id="file-1")
+    for i in range(6):
+        db.add_entry(f"note {i}", [float(i)] * 4, {"type": "note"}, entry_id=f"note-{i}")
+    index = db.shard_index({"file_key": "k"})
+    notes = [i for i in db.shards[index].all_entry_ids() if i.startswith("note-")]
+    assert notes
+    assert db.rebuild_shard(index, queue) == {"requeued": 1, "kept": len(notes)}
+    assert sorted(db.shards[index].all_entry_ids()) == sorted(notes)
+    assert db.get_by_id(notes[0])["metadata"] == {"type": "note"}
+
+def test_rebuild_shard_keeps_writes_made_during_rebuild(tmp_path):
+    import threading
+
+    db = ShardedChromaDatabase(num_shards=2, db_path=str(tmp_path / "sharded5"))
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    db.add_entry("old", [1.0] * 4, {"file_key": "k", "path": "/tmp/f.txt"})
+    index = db.shard_index({"file_key": "k"})
+    shard = db.shards[index]
+    writer = threading.Thread(target=db.add_entry,
+                              args=("new note", [2.0] * 4, {"type": "note"}, "late"))
+    reset = shard.reset
+
+    def reset_while_ingesting():
+        writer.start()
+        writer.join(0.2)  # an ingest write arrives between the scan and the reset
+        reset()
+
+    shard.reset = reset_while_ingesting
+    db.rebuild_shard(index, queue)
+    writer.join()
+    assert db.get_by_id("late")["text"] == "new note"
+
+def test_reshard_imports_old_collections(tmp_path):
+    path = str(tmp_path / "reshard")
+    single = ChromaDatabase(db_path=path)
+    for i in range(8):
+        meta = {"file_key": f"key-{i}", "path": f"/tmp/f{i}.txt"} if i % 2 else {"type": "note"}
+        single.add_entry(f"entry {i}", [float(i)] * 4, meta, entry_id=f"id-{i}")
+
+    three = ShardedChromaDatabase(num_shards=3, db_path=path)
+    assert three.all_entry_ids() == []  # old collection is invisible until resharded
+    report = reshard(three)
+    assert report["imported"] == ["assistant_data"] and report["copied"] == 8
+    assert sorted(three.all_entry_ids()) == [f"id-{i}" for i in range(8)]
+    assert three.file_already_learned("key-3")
+
+    two = ShardedChromaDatabase(num_shards=2, db_path=path, shard_by="folder")
+    reshard(two)
+    assert sorted(two.all_entry_ids()) == [f"id-{i}" for i in range(8)]
+    for index, shard in enumerate(two.shards):
+        for entry_id in shard.all_entry_ids():
+            meta = shard.get_by_id(entry_id)["metadata"]
+            assert two.shard_index(meta, entry_id) == index
+
+def test_query_field_projection(tmp_path):
+    db = ChromaDatabase(db_path=tmp_path / "test_chroma_proj")
+    db.add_entry(TEST_TEXT, [0.1] * 256, make_chroma_metadata(TEST_META), entry_id="note-1")
+    [hit] = db.query_similar([0.1] * 256, fields=["id", "distance"])
+    assert set(hit) == {"id", "distance"} and hit["id"] == "note-1"
+    [hit] = db.query_similar([0.1] * 256, fields=["text"], max_text_chars=7)
+    assert hit == {"text": TEST_TEXT[:7]}
+    with pytest.raises(ValueError):
+        db.query_similar([0.1] * 256, fields=["embedding"])
+
+def test_sharded_projection_without_distance(tmp_path):
+    db = ShardedChromaDatabase(num_shards=2, db_path=str(tmp_path / "sharded3"))
+    for i in range(4):
+        db.add_entry(f"note {i}", [float(i)] * 4, {"file_key": f"key-{i}"}, entry_id=f"id-{i}")
+    results = db.query_similar([0.0] * 4, n_results=2, fields=["id"])
+    assert results == [{"id": "id-0"}, {"id": "id-1"}]
+
+class BatchEmbedder:
+    def embed(self, texts):
+        return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+def test_reshard_after_migration_adopts_the_model(tmp_path):
+    from app.migrate import ReembedMigration
+
+    path = str(tmp_path / "migrated")
+    single = ChromaDatabase(db_path=path)
+    for i in range(4):
+        single.add_entry(f"entry {i}", [float(i)] * 4, {"path": f"/tmp/f{i}.txt"}, entry_id=f"id-{i}")
+    migration = ReembedMigration(single, "m2", page_size=2)
+    migration.embedder = BatchEmbedder()
+    migration.grace_seconds = 0
+    assert migration.run()["state"] == "done"
+
+    two = ShardedChromaDatabase(num_shards=2, db_path=path)
+    report = reshard(two)
+    assert report["imported"] == ["assistant_data__m2"] and report["skipped"] == []
+    assert two.active_model == "m2"
+    assert sorted(two.all_entry_ids()) == [f"id-{i}" for i in range(4)]
+    assert len(two.query_similar([7.0, 1.0, 0.0], n_results=4)) == 4
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+import pytest
+
+from app.endpoints import EndpointPool
+
+
+def test_pool_picks_least_outstanding():
+    pool = EndpointPool(["http://a", "http://b"])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.url, second.url} == {"http://a", "http://b"}
+    pool.release(first, 0.01, ok=True)
+    assert pool.acquire() is first
+
+
+def test_pool_ejects_and_readmits():
+    pool = EndpointPool(["http://a", "http://b"], eject_after=2, cooldown=0.05)
+    bad = pool.endpoints[0]
+    for _ in range(2):
+        pool.release(bad, 0.01, ok=False)
+    assert pool.healthy_count() == 1
+    assert all(pool.acquire().url == "http://b" for _ in range(5))
+
+    bad.ejected_until = 0  # cooldown expired
+    assert pool.healthy_count() == 2
+    pool.release(bad, 0.01, ok=False)  # the re-admission probe fails
+    assert pool.healthy_count() == 1
+    assert pool.stats()[0]["ejections"] == 2
+
+
+def test_pool_reports_outage_when_every_endpoint_is_down():
+    pool = EndpointPool(["http://a", "http://b"], eject_after=2, cooldown=5)
+    a, b = pool.endpoints
+    pool.release(a, 0.01, ok=False, reachable=False)  # connection refused
+    assert pool.outage() is None  # b may still work
+    for _ in range(2):
+        pool.release(b, 0.01, ok=False)
+    assert 1 <= pool.outage() <= 5
+    pool.release(a, 0.01, ok=True)
+    assert pool.outage() is None
+
+
+def test_refused_connection_defers_without_using_an_attempt(tmp_path, stub_db):
+    pytest.importorskip("requests")
+    import socket
+    from app.embeddings import Embedder
+    from app.ingest_files import process_next_file
+    from app.learn import Learner
+    from app.queue import IngestQueue
+
+    with socket.socket() as s:  # a port nothing listens on
+        s.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{s.getsockname()[1]}/api/embeddings"
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    for i in range(3):
+        note = tmp_path / f"note{i}.txt"
+        note.write_text(f"note {i}")
+        queue.add_to_queue(str(note))
+
+    process_next_file(queue, Learner(Embedder(url=url), stub_db), stub_db)
+    assert queue.get_next_file() is None  # claims paused for the outage
+    assert queue.counts() == {"pending": 2, "retry": 1}
+    queue._paused_until = 0
+    assert queue.get_next_file() == str(tmp_path / "note1.txt")
+    assert "failed" not in queue.counts()
+
+
+def _stub_server(fail=False, delay=0.0, threaded=True):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            if fail:
+                self.send_response(500)
+                self.end_headers()
+                return
+            prompt = body["prompt"]
+            if isinstance(prompt, list):
+                data = {"embeddings": [[0.1] * 8 for _ in prompt]}
+            else:
+                data = {"embedding": [0.1] * 8}
+            payload = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    # A non-threaded server handles one request at a time, like a busy model server
+    server = (ThreadingHTTPServer if threaded else HTTPServer)(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/embeddings"
+
+
+def test_embedder_spreads_across_stub_servers():
+    pytest.importorskip("requests")
+    from app.embeddings import Embedder
+
+    servers = [_stub_server() for _ in range(2)] + [_stub_server(fail=True)]
+    embedder = Embedder(url=[url for _, url in servers])
+    try:
+        vectors = embedder.embed([f"text {i}" for i in range(64)])
+        assert len(vectors) == 64
+        for i in range(10):
+            assert embedder.embed(f"single {i}") is not None
+
+        stats = {s["url"]: s for s in embedder.stats()["endpoints"]}
+        assert all(stats[url]["items_per_sec"] > 0 for _, url in servers[:2])
+        assert stats[servers[2][1]]["errors"] > 0
+    finally:
+        for server, _ in servers:
+            server.shutdown()
+
+
+def test_ingest_throughput_scales_with_endpoints(ingest):
+    pytest.importorskip("requests")
+    from app.embeddings import Embedder
+
+    servers = [_stub_server(delay=0.05, threaded=False) for _ in range(3)]
+    try:
+        one_pool, one = ingest(30, embedder=Embedder(url=[servers[0][1]]), name="one")
+        embedder = Embedder(url=[u for _, u in servers])
+        three_pool, three = ingest(30, embedder=embedder, name="three")
+        assert three_pool.num_workers == 3 * one_pool.num_workers
+        assert all(s["requests"] > 0 for s in embedder.stats()["endpoints"])
+        assert three < 0.6 * one
+    finally:
+        for server, _ in servers:
+            server.shutdown()
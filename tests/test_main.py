@@ -0,0 +1,42 @@
+import importlib
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DB_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setenv("QUEUE_DB", str(tmp_path / "queue.sqlite3"))
+    main = importlib.import_module("app.main")
+    main = importlib.reload(main)
+    monkeypatch.setattr(main.embedder, "embed", lambda text, priority=None: [float(len(text)), 1.0, 0.0])
+    main.db.add_entry("hello world", [11.0, 1.0, 0.0], {"path": "/tmp/a.txt"}, entry_id="a")
+    return TestClient(main.app)  # no `with`: the ingest workers stay stopped
+
+
+@pytest.mark.parametrize("body, key", [
+    ({"n_results": "abc"}, "n_results"),
+    ({"n_results": None}, "n_results"),
+    ({"n_results": True}, "n_results"),
+    ({"max_text_chars": "x"}, "max_text_chars"),
+    ({"max_text_chars": 2.5}, "max_text_chars"),
+])
+def test_search_rejects_bad_params(api, body, key):
+    response = api.post("/search", json={"query": "hello", **body})
+    assert response.status_code == 200
+    assert key in response.json()["error"]
+
+
+def test_search_returns_projected_json(api):
+    response = api.post("/search", json={"query": "hello", "n_results": 1,
+                                         "fields": ["id", "text"], "max_text_chars": 5})
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"results": [{"id": "a", "text": "hello"}]}
+
+
+def test_migrate_compares_against_the_collection_model(api):
+    from app.main import db
+    db.switch_collection(db.active_collection, "model-that-built-them")
+    response = api.post("/admin/migrate", json={"model": "model-that-built-them"})
+    assert "Already using" in response.json()["error"]
+    assert api.get("/admin/migrate").json() == {"state": "idle", "model": "model-that-built-them"}
@@ -0,0 +1,132 @@
+from app.db import ChromaDatabase
+from app.learn import Learner
+from app.migrate import ReembedMigration, versioned_name
+from app.utilities.config import load_config
+
+
+class FakeEmbedder:
+    """Stands in for the new model: a different vector per document."""
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def embed(self, texts):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            return None
+        return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+
+class ModelEmbedder:
+    """Live embedder stand-in: the vector records which model produced it."""
+    def __init__(self, model, on_embed=None):
+        self.model = model
+        self.on_embed = on_embed
+        self.calls = []
+
+    def embed(self, text):
+        self.calls.append(self.model)
+        vector = [1.0 if self.model == "m2" else 0.0, float(len(text)), 0.0]
+        if self.on_embed is not None:
+            self.on_embed, hook = None, self.on_embed
+            hook()
+        return vector
+
+
+def _seed(db, n):
+    for i in range(n):
+        db.add_entry(f"note {'x' * i}", [0.5] * 4, {"path": f"/tmp/{i}.txt"}, entry_id=f"id-{i}")
+
+
+def test_migration_copies_and_switches(tmp_path):
+    db = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    _seed(db, 10)
+    migration = ReembedMigration(db, "new-model:v2", page_size=3)
+    migration.embedder = FakeEmbedder()
+    migration.grace_seconds = 0
+
+    status = migration.run()
+    assert status["state"] == "done"
+    assert status["copied"] == 10
+    assert db.active_collection == versioned_name("assistant_data", "new-model:v2")
+    assert db.active_model == "new-model:v2"
+    assert len(db.query_similar([5.0, 1.0, 0.0], n_results=3)) == 3
+
+    # The switch survives a restart
+    reopened = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    assert reopened.active_model == "new-model:v2"
+    assert len(reopened.all_entry_ids()) == 10
+
+
+def test_migration_resumes_after_interruption(tmp_path):
+    db = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    _seed(db, 10)
+    migration = ReembedMigration(db, "new-model", page_size=3)
+    migration.embedder = FakeEmbedder(fail_after=2)
+    migration.grace_seconds = 0
+    old_model = db.active_model
+    assert migration.run()["state"] == "failed"
+    assert db.active_model == old_model  # old collection still serving
+
+    resumed = ReembedMigration(db, "new-model", page_size=3)
+    resumed.embedder = FakeEmbedder()
+    resumed.grace_seconds = 0
+    assert resumed.run()["state"] == "done"
+    assert resumed.embedder.calls == 2  # only the pages after the checkpoint
+    assert len(db.all_entry_ids()) == 10
+
+
+def test_other_process_picks_up_switch(tmp_path):
+    # A worker process opened the database before a CLI migration ran
+    worker_db = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    _seed(worker_db, 3)
+    learner = Learner(ModelEmbedder("m1"), worker_db)
+
+    cli_db = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    migration = ReembedMigration(cli_db, "m2", page_size=3)
+    migration.embedder = FakeEmbedder()
+    migration.grace_seconds = 0
+    assert migration.run()["state"] == "done"
+
+    result = learner.learn_text("after the switch", {"path": "/tmp/new.txt"})
+    assert result["status"] == "success"
+    assert learner.embedder.calls == ["m2"]
+    assert worker_db.active_collection == versioned_name("assistant_data", "m2")
+    entry = cli_db.get_by_id(result["id"])
+    assert entry["metadata"]["embedding_model"] == "m2"
+
+
+def test_switch_between_embed_and_insert_reembeds(tmp_path):
+    db = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    _seed(db, 3)
+    migration = ReembedMigration(db, "m2", page_size=3)
+    migration.embedder = FakeEmbedder()
+    migration.grace_seconds = 0
+    embedder = ModelEmbedder(db.active_model, on_embed=migration.run)
+    migration.live_embedder = embedder
+
+    # The migration completes while the first embed (old model) is in flight
+    result = Learner(embedder, db).learn_text("racing note", {"path": "/tmp/race.txt"})
+    assert result["status"] == "success"
+    assert embedder.calls == [load_config()["embedding_model"], "m2"]
+    entry = db.get_by_id(result["id"])
+    assert entry["metadata"]["embedding_model"] == "m2"
+    assert db.active_collection == versioned_name("assistant_data", "m2")
+
+
+def test_new_collection_records_configured_model(tmp_path):
+    db = ChromaDatabase(db_path=str(tmp_path / "chroma"))
+    assert db.active_model == load_config()["embedding_model"]
+
+    # A later config change doesn't silently re-point the stored vectors
+    db.switch_collection(db.active_collection, "model-that-built-them")
+    assert ChromaDatabase(db_path=str(tmp_path / "chroma")).active_model == "model-that-built-them"
+
+
+def test_migration_shares_the_live_limiter(tmp_path):
+    from app.embeddings import Embedder
+
+    live = Embedder(url=["http://127.0.0.1:1/a", "http://127.0.0.1:1/b"])
+    migration = ReembedMigration(ChromaDatabase(db_path=str(tmp_path / "chroma")), "m2", embedder=live)
+    assert migration.embedder.limiter is live.limiter
+    assert migration.embedder.urls == live.urls
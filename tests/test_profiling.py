@@ -0,0 +1,76 @@
+import threading
+import time
+
+from app.profiling import SamplingProfiler, SlowOpTracer
+
+
+def test_tracer_records_slow_ops_with_spans():
+    tracer = SlowOpTracer(enabled=True, threshold_ms=20, capacity=2)
+    with tracer.trace("ingest", "/tmp/a.txt"):
+        with tracer.span("embed"):
+            time.sleep(0.03)
+        with tracer.span("chroma.add"):
+            pass
+    with tracer.trace("search", "fast"):
+        pass  # under threshold, not recorded
+
+    [record] = tracer.records()
+    assert record["name"] == "ingest"
+    assert record["key"] == "/tmp/a.txt"
+    assert record["spans_ms"]["embed"] >= 20
+    assert set(record["spans_ms"]) == {"embed", "chroma.add", "other"}
+
+    for i in range(3):
+        with tracer.trace("search", str(i)):
+            time.sleep(0.025)
+    assert [r["key"] for r in tracer.records()] == ["2", "1"]  # bounded, newest first
+
+
+def test_tracer_disabled_is_noop():
+    tracer = SlowOpTracer(enabled=False, threshold_ms=0)
+    with tracer.trace("ingest") as trace:
+        with tracer.span("embed"):
+            pass
+    assert trace is None
+    assert tracer.records() == []
+
+
+def test_profiler_returns_collapsed_stacks():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    t = threading.Thread(target=busy_loop, name="busy")
+    t.start()
+    try:
+        stacks = SamplingProfiler().run(0.2, interval=0.005)
+    finally:
+        stop.set()
+        t.join()
+    lines = stacks.splitlines()
+    assert any(line.startswith("busy;") and "busy_loop" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_records_safe_while_threads_append():
+    tracer = SlowOpTracer(enabled=True, threshold_ms=0, capacity=50)
+    stop = threading.Event()
+
+    def ingest():
+        while not stop.is_set():
+            with tracer.trace("ingest"):
+                pass
+
+    threads = [threading.Thread(target=ingest) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            tracer.records(name="ingest")  # raised "deque mutated during iteration"
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
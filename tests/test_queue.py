@@ -0,0 +1,114 @@
+import threading
+import time
+
+from app.queue import IngestQueue
+
+
+def test_failed_file_is_retried_not_dropped(tmp_path):
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    queue.retry_backoff = 0
+    queue.add_to_queue("/tmp/a.txt")
+
+    assert queue.get_next_file() == "/tmp/a.txt"
+    queue.mark_failed("/tmp/a.txt", "Embedding failed.")
+    assert len(queue) == 1
+    assert queue.get_next_file() == "/tmp/a.txt"
+    queue.mark_done("/tmp/a.txt")
+    assert len(queue) == 0
+
+
+def test_backoff_and_max_retries(tmp_path):
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    queue.max_retries = 2
+    queue.retry_backoff = 60
+    queue.add_to_queue("/tmp/b.txt")
+
+    queue.get_next_file()
+    queue.mark_failed("/tmp/b.txt", "timeout")
+    assert queue.get_next_file() is None  # still backing off
+
+    queue.retry_backoff = 0
+    queue.mark_failed("/tmp/b.txt", "timeout")
+    assert len(queue) == 0  # gave up, status 'failed'
+
+
+def test_scan_revives_failed_files(tmp_path):
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    queue.max_retries = 1
+    queue.add_to_queue("/tmp/f.txt")
+    queue.get_next_file()
+    queue.mark_failed("/tmp/f.txt", "server down")
+    assert queue.counts() == {"failed": 1}
+
+    assert queue.retry_failed() == 1
+    assert queue.get_next_file() == "/tmp/f.txt"
+
+
+def test_wait_for_work_wakes_on_enqueue(tmp_path):
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    seen = queue.generation
+    assert not queue.wait_for_work(seen, timeout=0.3)
+
+    threading.Timer(0.05, queue.add_to_queue, args=("/tmp/c.txt",)).start()
+    start = time.monotonic()
+    assert queue.wait_for_work(seen, timeout=5)
+    assert time.monotonic() - start < 1
+
+
+def test_wait_for_work_sees_other_process_commits(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    worker_side = IngestQueue(db_path=path)
+    producer_side = IngestQueue(db_path=path)  # stands in for another process
+    seen = worker_side.generation
+
+    threading.Timer(0.05, producer_side.add_to_queue, args=("/tmp/d.txt",)).start()
+    assert worker_side.wait_for_work(seen, timeout=5)
+    assert worker_side.get_next_file() == "/tmp/d.txt"
+
+
+def test_idle_waiters_share_one_watcher(tmp_path):
+    queue = IngestQueue(db_path=str(tmp_path / "queue.sqlite3"))
+    queue.poll_interval = 0.05
+    checks = []
+    check = queue._external_change
+    queue._external_change = lambda: checks.append(1) or check()
+
+    seen = queue.generation
+    waiters = [threading.Thread(target=queue.wait_for_work, args=(seen,)) for _ in range(24)]
+    for t in waiters:
+        t.start()
+    time.sleep(0.5)
+    assert len(checks) <= 0.5 / queue.poll_interval + 2  # not once per waiter
+
+    queue.notify()
+    for t in waiters:
+        t.join(1)
+    assert not any(t.is_alive() for t in waiters)
+
+
+def test_worker_pool_processes_and_stops(ingest):
+    class StubLearner:
+        def __init__(self):
+            self.learned = []
+        def learn_text(self, text, metadata):
+            self.learned.append(metadata["name"])
+            return {"status": "success", "id": "x"}
+
+    learner = StubLearner()
+    pool, _ = ingest(3, learner=learner, num_workers=3)
+    assert sorted(learner.learned) == ["note0.txt", "note1.txt", "note2.txt"]
+    assert not pool.running
+
+
+def test_stale_processing_claim_is_reclaimed(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    crashed = IngestQueue(db_path=path)
+    crashed.add_to_queue("/tmp/e.txt")
+    assert crashed.get_next_file() == "/tmp/e.txt"  # worker dies mid-file
+
+    restarted = IngestQueue(db_path=path)
+    assert restarted.get_next_file() is None  # claim still fresh
+    restarted.claim_timeout = 0
+    assert restarted.get_next_file() == "/tmp/e.txt"
+    restarted.mark_done("/tmp/e.txt")
+    assert len(restarted) == 0
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from app.throttle import AdaptiveLimiter, INTERACTIVE, BACKGROUND
+
+
+def test_limiter_grows_on_fast_responses():
+    limiter = AdaptiveLimiter(initial_concurrency=1, max_concurrency=4,
+                              initial_batch=2, max_batch=8, target_latency=1.0)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(0.01, ok=True)
+    assert limiter.limit == 4
+    assert limiter.batch_size == 8
+
+
+def test_limiter_backs_off_on_errors():
+    limiter = AdaptiveLimiter(initial_concurrency=8, max_concurrency=8,
+                              initial_batch=32, target_latency=1.0)
+    limiter.acquire()
+    limiter.release(0.01, ok=False)
+    assert limiter.limit == 4
+    assert limiter.batch_size == 16
+    assert limiter.stats()["errors"] == 1
+
+
+def test_interactive_admitted_ahead_of_background():
+    limiter = AdaptiveLimiter(initial_concurrency=1, max_concurrency=1, interactive_reserve=1)
+    assert limiter.acquire(BACKGROUND)
+    # Background is saturated, but interactive still gets the reserve slot
+    assert limiter.acquire(INTERACTIVE, timeout=0.1)
+    assert not limiter.acquire(BACKGROUND, timeout=0.05)
+
+    order = []
+    def waiter(priority):
+        limiter.acquire(priority)
+        order.append(priority)
+
+    bg = threading.Thread(target=waiter, args=(BACKGROUND,))
+    bg.start()
+    time.sleep(0.05)
+    fg = threading.Thread(target=waiter, args=(INTERACTIVE,))
+    fg.start()
+    time.sleep(0.05)
+    limiter.release(0.01, ok=True)
+    fg.join(1)
+    assert order == [INTERACTIVE]
+    limiter.release(0.01, ok=True)
+    limiter.release(0.01, ok=True)
+    bg.join(1)
+    assert order == [INTERACTIVE, BACKGROUND]
+
+
+def test_parked_worker_wakes_without_polling():
+    limiter = AdaptiveLimiter(min_concurrency=1, max_concurrency=4, initial_concurrency=1,
+                              target_latency=1.0)
+    stop = threading.Event()
+    woke = []
+    parked = threading.Thread(
+        target=lambda: woke.append(limiter.wait_for_capacity(1, cancelled=stop.is_set)))
+    parked.start()
+    parked.join(0.1)
+    assert parked.is_alive()
+
+    limiter.acquire()
+    limiter.release(0.01, ok=True)  # limit grows to 2: worker 1 may run
+    parked.join(1)
+    assert woke == [True]
+
+    parked = threading.Thread(target=limiter.wait_for_capacity, args=(3,),
+                              kwargs={"cancelled": stop.is_set})
+    parked.start()
+    stop.set()
+    limiter.wake()
+    parked.join(1)
+    assert not parked.is_alive()
+
+
+class _LatencyEmbedder:
+    """Embedder stand-in with fixed latency that goes through a real limiter."""
+    def __init__(self, limiter, latency):
+        self.limiter = limiter
+        self.latency = latency
+        self.in_flight = 0
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def embed(self, text, priority=BACKGROUND):
+        with self.limiter.slot(priority):
+            with self._lock:
+                self.in_flight += 1
+                self.samples.append(self.in_flight)
+            time.sleep(self.latency)
+            with self._lock:
+                self.in_flight -= 1
+        return [0.1] * 4
+
+
+def test_ingest_concurrency_grows_when_fast(ingest):
+    limiter = AdaptiveLimiter(initial_concurrency=1, max_concurrency=4, target_latency=1.0)
+    embedder = _LatencyEmbedder(limiter, latency=0.02)
+    pool, _ = ingest(40, embedder=embedder)
+    assert pool.num_workers == 4
+    assert embedder.samples[0] == 1
+    assert max(embedder.samples) >= 3
+    assert limiter.limit == 4
+
+
+def test_ingest_concurrency_shrinks_when_slow(ingest):
+    limiter = AdaptiveLimiter(initial_concurrency=4, max_concurrency=4, target_latency=0.01)
+    embedder = _LatencyEmbedder(limiter, latency=0.05)
+    ingest(20, embedder=embedder)
+    assert max(embedder.samples[:4]) >= 3
+    assert limiter.limit == 1
+    assert embedder.samples[-5:] == [1] * 5